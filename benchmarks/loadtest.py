@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""
+Load test for the jsx template tag.
+
+Renders a synthetic page with many jsx blocks through the Django test client,
+from a pool of threads and a pool of processes, and reports throughput,
+latency and peak memory use. Everything runs in-process and offline.
+
+    python benchmarks/loadtest.py --blocks 50 --rows 100 --requests 500
+    python benchmarks/loadtest.py --save-baseline    # store results to compare to
+    python benchmarks/loadtest.py                    # exits 1 if slower than baseline
+    python benchmarks/loadtest.py --scaling          # throughput with 1, 2, 4... threads
+
+Every response is checked against the first one, so renders from different
+threads getting mixed up fails the run.
+
+Baselines depend on the machine they were measured on, so only compare runs
+from the same machine.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+try:
+    from django.urls import re_path  # noqa: E402
+except ImportError:  # Django 1.11
+    from django.conf.urls import url as re_path  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# The page and its context, set up by setup() in every process
+PAGE = None
+CONTEXT = None
+# The body of the first response, which every other one must match
+EXPECTED = None
+
+
+def make_template(blocks, rows, depth):
+    """
+    Return the source of a page with `blocks` jsx blocks at the top level, and one
+    more inside a loop over `rows` rows. Each block refers to values `depth`
+    attributes deep, some from inside the loop and some from outside it.
+    """
+    lookup = '.'.join(['level%d' % level for level in range(depth)])
+    parts = ['{% load jsx %}<html><body>']
+    for block in range(blocks):
+        parts.append(
+            '<section>{%% jsx %%}<Widget%(block)d data={ctx.data.%(lookup)s.items} '
+            'title={ctx.title} count={ctx.data.%(lookup)s.count}/>{%% endjsx %%}</section>'
+            % {'block': block, 'lookup': lookup})
+    parts.append(
+        '<table>{% for row in rows %}<tr>{% jsx %}'
+        '<Row id={ctx.row.id} label={ctx.row.label} status={ctx.row.status} '
+        'title={ctx.title}/>{% endjsx %}</tr>{% endfor %}</table>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def make_context(rows, depth, payload):
+    """
+    Return a context for make_template's page, with `payload` items in each
+    block's list.
+    """
+    data = {
+        'items': [
+            {'id': i, 'name': 'Item number %d' % i, 'url': '/items/%d/' % i,
+             'tags': ['alpha', 'beta', 'gamma']}
+            for i in range(payload)
+        ],
+        'count': payload,
+    }
+    for level in reversed(range(depth)):
+        data = {'level%d' % level: data}
+    return {
+        'title': 'Load test',
+        'data': data,
+        'rows': [
+            {'id': i, 'label': 'Row %d' % i, 'status': 'active' if i % 2 else 'inactive'}
+            for i in range(rows)
+        ],
+    }
+
+
+def view(request):
+    from django.http import HttpResponse
+    from django.template import RequestContext
+    return HttpResponse(PAGE.render(RequestContext(request, CONTEXT)))
+
+
+def setup(options):
+    """Configure Django and build the page, once per process."""
+    global PAGE, CONTEXT
+    if not settings.configured:
+        settings.configure(
+            DEBUG=False,
+            ALLOWED_HOSTS=['*'],
+            ROOT_URLCONF=__name__,
+            INSTALLED_APPS=['django_jsx'],
+            MIDDLEWARE=[],
+            TEMPLATES=[{
+                'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                'OPTIONS': {
+                    'context_processors': ['django.template.context_processors.request'],
+                },
+            }],
+        )
+        django.setup()
+    from django.template import engines
+    PAGE = engines['django'].engine.from_string(
+        make_template(options['blocks'], options['rows'], options['depth']))
+    CONTEXT = make_context(options['rows'], options['depth'], options['payload'])
+
+
+# This module is the ROOT_URLCONF
+urlpatterns = [re_path(r'^$', view)]
+
+
+def run_requests(count):
+    """Make `count` requests, and return how long each one took, in seconds."""
+    global EXPECTED
+    from django.test import Client
+    client = Client()
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get('/')
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+        if EXPECTED is None:
+            EXPECTED = response.content
+        assert response.content == EXPECTED, "response differs from the first one"
+    return timings
+
+
+def run_process_worker(options, count):
+    setup(options)
+    run_requests(1)  # warm up this process, like main() did for the threads
+    return run_requests(count)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children, in MB."""
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    scale = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / scale
+
+
+def run(mode, options, workers=None):
+    """Run the load test with a pool of threads or processes, return the results."""
+    workers = workers or options['workers']
+    batches = [options['requests'] // workers] * workers
+    for i in range(options['requests'] % workers):
+        batches[i] += 1
+    if mode == 'thread':
+        executor = ThreadPoolExecutor(max_workers=workers)
+        submit = run_requests
+        args = [(batch,) for batch in batches]
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        submit = run_process_worker
+        args = [(options, batch) for batch in batches]
+    with executor:
+        start = time.perf_counter()
+        futures = [executor.submit(submit, *arg) for arg in args]
+        timings = [timing for future in futures for timing in future.result()]
+        elapsed = time.perf_counter() - start
+    return {
+        'requests_per_second': len(timings) / elapsed,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def scaling(options):
+    """
+    Run the thread pool load test with 1, 2, 4... up to `workers` threads and print
+    the throughput of each relative to one thread.
+    """
+    counts = [1]
+    while counts[-1] * 2 <= options['workers']:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != options['workers']:
+        counts.append(options['workers'])
+    single = None
+    for workers in counts:
+        result = run('thread', options, workers)
+        single = single or result['requests_per_second']
+        print('%3d threads %8.1f requests/s  %5.2fx  p50 %7.2f ms  p99 %7.2f ms' % (
+            workers, result['requests_per_second'], result['requests_per_second'] / single,
+            result['p50_ms'], result['p99_ms']))
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of the ways `results` are worse than `baseline`."""
+    regressions = []
+    for mode, result in sorted(results.items()):
+        expected = baseline.get(mode)
+        if not expected:
+            continue
+        if result['requests_per_second'] < expected['requests_per_second'] * (1 - tolerance):
+            regressions.append('%s: %.1f requests/s, baseline %.1f' % (
+                mode, result['requests_per_second'], expected['requests_per_second']))
+        for key in ['p50_ms', 'p99_ms', 'peak_rss_mb']:
+            if result[key] > expected[key] * (1 + tolerance):
+                regressions.append('%s: %s %.1f, baseline %.1f' % (
+                    mode, key, result[key], expected[key]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--blocks', type=int, default=20, help="jsx blocks outside the loop")
+    parser.add_argument('--rows', type=int, default=100, help="rows in the loop, one block each")
+    parser.add_argument('--depth', type=int, default=3, help="depth of the ctx expressions")
+    parser.add_argument('--payload', type=int, default=20, help="list items in each block")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--mode', choices=['thread', 'process', 'both'], default='both')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the baseline instead of comparing")
+    parser.add_argument('--scaling', action='store_true',
+                        help="compare the throughput of thread pools of increasing size")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="how much worse than the baseline is still OK (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    options = {
+        'blocks': args.blocks, 'rows': args.rows, 'depth': args.depth,
+        'payload': args.payload, 'requests': args.requests, 'workers': args.workers,
+    }
+    setup(options)
+    run_requests(5)  # warm up
+
+    if args.scaling:
+        scaling(options)
+        return 0
+
+    results = {}
+    for mode in (['thread', 'process'] if args.mode == 'both' else [args.mode]):
+        results[mode] = result = run(mode, options)
+        print('%-8s %8.1f requests/s  p50 %7.2f ms  p99 %7.2f ms  peak RSS %6.1f MB' % (
+            mode, result['requests_per_second'], result['p50_ms'], result['p99_ms'],
+            result['peak_rss_mb']))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'options': options, 'results': results}, f, indent=2, sort_keys=True)
+        print('Saved baseline to %s' % args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['options'] != options:
+        print('Not comparing to %s, it was run with different options: %s' % (
+            args.baseline, baseline['options']))
+        return 0
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print('REGRESSION %s' % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Cold start benchmark for the jsx template tag library.
+
+Starts fresh Python processes and measures, in each, how long it takes to
+import django_jsx.templatetags.jsx (after Django itself is set up), and to
+parse and render a first template using it. Reports the median of the runs.
+
+    python benchmarks/startup.py --runs 20
+    python benchmarks/startup.py --setting JSX_INTERN_STRINGS=1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in each fresh process. Prints the timings, in seconds, as JSON.
+MEASURE = """
+import json, sys, time
+import django
+from django.conf import settings
+settings.configure(
+    INSTALLED_APPS=['django_jsx'],
+    TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates'}],
+    **json.loads(sys.argv[1]))
+django.setup()
+
+start = time.perf_counter()
+import django_jsx.templatetags.jsx
+imported = time.perf_counter()
+
+from django.template import Context, engines
+template = engines['django'].engine.from_string(
+    '{% load jsx %}{% for i in items %}{% jsx %}<Item i={ctx.i} title={ctx.title}/>'
+    '{% endjsx %}{% endfor %}')
+template.render(Context({'items': [1, 2, 3], 'title': 'Title'}))
+rendered = time.perf_counter()
+
+print(json.dumps({'import_ms': (imported - start) * 1000,
+                  'first_render_ms': (rendered - imported) * 1000,
+                  'modules': len(sys.modules)}))
+"""
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--setting', action='append', default=[], metavar='NAME=VALUE',
+                        help="extra Django setting (a string) to run with, can be repeated")
+    args = parser.parse_args(argv)
+
+    extra_settings = dict(setting.split('=', 1) for setting in args.setting)
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', MEASURE, json.dumps(extra_settings)], env=env)
+        runs.append(json.loads(output.decode('utf-8')))
+
+    for key, label in [('import_ms', 'import'), ('first_render_ms', 'first render')]:
+        print('%-13s median %6.2f ms  min %6.2f ms  max %6.2f ms' % (
+            label, median([run[key] for run in runs]),
+            min(run[key] for run in runs), max(run[key] for run in runs)))
+    print('modules loaded: %d' % runs[-1]['modules'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
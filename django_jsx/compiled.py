@@ -0,0 +1,75 @@
+"""
+The parts of a jsx block that only depend on its text, worked out once.
+
+Every `{% jsx %}` block in every template turns into a CompiledJsx when the
+template is parsed. Identical blocks (the same block included from several
+templates, or parsed again by another template engine) share one CompiledJsx.
+"""
+import re
+from collections import OrderedDict
+from hashlib import sha1
+
+from django.template.base import Variable
+
+# Regex to find references to context that start with "ctx."
+# and look like "ctx.foo.bar" or "ctx.3.xyz" etc.
+R_CTXEXPR = re.compile(r'\.*ctx\.([A-Za-z][\d\w\.]*)')
+
+# CompiledJsx for each block text seen so far in this process. Shared by all
+# threads without a lock: entries are only ever added, with setdefault, so
+# threads compiling the same block at once all end up using the same (and in
+# any case equal) CompiledJsx.
+_compiled = {}
+
+
+class CompiledJsx(object):
+    """
+    An immutable, compact description of a jsx block:
+
+    sha1) The sha1 hex digest of the block's text.
+
+    expressions) The context expressions to serialize, e.g. ("foo.bar", "baz").
+
+    groups) The expressions grouped by the top level name they refer to, in
+    order of first appearance, each with its parsed ``Variable``. Each group
+    becomes one key of the serialized context.
+
+    prefix and suffix) The markup the block renders to, either side of the
+    serialized context.
+    """
+    __slots__ = ('sha1', 'expressions', 'groups', 'prefix', 'suffix')
+
+    def __init__(self, sha1, expressions):
+        groups = OrderedDict()
+        for expression in expressions:
+            groups.setdefault(expression.split('.')[0], []).append(
+                (expression, Variable(expression)))
+        set_attr = super(CompiledJsx, self).__setattr__
+        set_attr('sha1', sha1)
+        set_attr('expressions', tuple(expressions))
+        set_attr('groups', tuple((name, tuple(group)) for name, group in groups.items()))
+        set_attr('prefix', '<script type="script/django-jsx" data-sha1="%s" data-ctx="' % sha1)
+        set_attr('suffix', '"></script>')
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledJsx objects are immutable")
+
+    def __repr__(self):
+        return '<CompiledJsx %s %r>' % (self.sha1, self.expressions)
+
+
+def compile_jsx(jsx, fields=None):
+    """
+    Return the CompiledJsx for a block whose text is `jsx`.
+
+    :param fields: If given, the expressions to serialize instead of the ones
+      found in the JSX.
+    """
+    compiled = _compiled.get(jsx)
+    if compiled is None:
+        compiled = CompiledJsx(
+            sha1(jsx.encode('utf-8')).hexdigest(), R_CTXEXPR.findall(jsx))
+        compiled = _compiled.setdefault(jsx, compiled)
+    if fields is not None:
+        compiled = CompiledJsx(compiled.sha1, fields)
+    return compiled
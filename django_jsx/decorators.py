@@ -0,0 +1,73 @@
+from functools import wraps
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from django_jsx.middleware import get_usage
+
+
+def jsx_etag(view_func=None, version=None):
+    """
+    Decorator for views whose pages only change through the context of their
+    jsx blocks. The response gets an ETag worked out from the blocks and their
+    serialized context as they're rendered, and conditional GET and HEAD
+    requests whose ETag still matches get a 304 Not Modified instead of the page.
+
+    Everything else on the page is assumed not to change, so a `version` is
+    required, and mixed into the ETag. It defaults to the JSX_ETAG_VERSION
+    setting; set that to something that changes with each deploy (a release
+    number, say), so changes to the templates themselves aren't hidden behind
+    old ETags. Pages with other content that changes between requests (a CSRF
+    token, the user's name, messages) shouldn't use this decorator.
+
+    Needs the `request` context processor, so the template tag can find the request.
+
+        @jsx_etag
+        def dashboard(request):
+            ...
+
+        @jsx_etag(version='2018-06-01')
+        def report(request):
+            ...
+    """
+    def decorator(func):
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            etag_version = version or getattr(settings, 'JSX_ETAG_VERSION', None)
+            if not etag_version:
+                raise ImproperlyConfigured(
+                    "jsx_etag needs a version, either the JSX_ETAG_VERSION setting or "
+                    "the decorator's version argument.")
+            usage = get_usage(request)
+            if usage.digest is None:
+                usage.digest = sha1()
+
+            def set_etag(response):
+                if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+                    return None
+                if not usage.sha1s or response.has_header('ETag'):
+                    return None
+                etag = sha1()
+                etag.update(str(etag_version).encode('utf-8'))
+                etag.update(b'\0')
+                etag.update(usage.digest.digest())
+                response['ETag'] = quote_etag(etag.hexdigest())
+                return get_conditional_response(
+                    request, etag=response['ETag'], response=response)
+
+            response = func(request, *args, **kwargs)
+            if not getattr(response, 'is_rendered', True):
+                # A TemplateResponse, whose blocks aren't rendered until it is. Leave
+                # rendering it to Django, after any process_template_response
+                # middleware has had its say.
+                response.add_post_render_callback(set_etag)
+                return response
+            return set_etag(response) or response
+        return inner
+
+    if view_func is None:
+        return decorator
+    return decorator(view_func)
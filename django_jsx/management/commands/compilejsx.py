@@ -1,19 +1,52 @@
 from __future__ import print_function, unicode_literals
 
+import fnmatch
+import io
+import json
+import mmap
 import os
 import re
 import hashlib
+import sys
+import tempfile
+from collections import namedtuple
 
 import django.template
+from django.conf import settings
 from django.template.backends.django import DjangoTemplates
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-# Regex matching all JSX blocks in a template
-R_JSX = re.compile(r'\{% *jsx *%\}(.*?)\{% *endjsx *%\}', re.DOTALL)
+# Regex matching all JSX blocks in a template, with or without options
+# like {% jsx fields="..." %}
+R_JSX = re.compile(r'\{% *jsx(?: +[^%]*?)? *%\}(.*?)\{% *endjsx *%\}', re.DOTALL)
+
+# Cheap check for whether a file might contain a JSX block at all, run against
+# the raw bytes of the file before we bother decoding it.
+R_JSX_START = re.compile(br'\{% *jsx')
 
 # Regex to spot the beginning of an HTML element in JSX text
 R_COMPONENT = re.compile(r'<(\w+)')
 
+# A jsx block found in a template: the template's filename, the sha1 of the
+# block's body, the body itself, and the sorted names of the elements it uses.
+JsxBlock = namedtuple('JsxBlock', ['template', 'sha1', 'jsx', 'components'])
+
+# The command's options that describe one output, and so can be used for each
+# output in a --config file instead
+OUTPUT_OPTIONS = ('output', 'include', 'exclude', 'extensions', 'manifest', 'manifest_asset',
+                  'components_index', 'components_module')
+# The options that write a file alongside the output
+OUTPUT_FILE_OPTIONS = ('manifest', 'components_index', 'components_module')
+# Extra options only available in a --config file
+CONFIG_OPTIONS = ('dirs', 'components')
+# The options that are lists of strings
+LIST_OPTIONS = ('include', 'exclude', 'extensions', 'dirs')
+
+try:
+    string_types = (basestring,)  # noqa: F821 (Python 2)
+except NameError:
+    string_types = (str,)
+
 START_JS = """
 import React from 'react';
 import ReactDOM from 'react-dom';
@@ -23,34 +56,132 @@ var jsx_registry = {};
 # <script type="script/django-jsx" ...>
 
 END_JS = """
-function renderAllDjangoJSX(COMPONENTS) {
-    Array.prototype.forEach.call(
-        // Find all "django-jsx" scripts which are hooks to render and inject react components
-        document.querySelectorAll('script[type^=script][type$=django-jsx]'),
-        function(el) {
+// Rendering time of each block, by sha1, in milliseconds
+var timings = {};
+var reportHooks = [];
+
+var perf = (typeof performance !== 'undefined') ? performance : null;
+
+function now() {
+    return (perf && perf.now) ? perf.now() : Date.now();
+}
+
+// Replace the {"$s": index} references to strings interned by {% jsx intern %}
+// with the strings from the block's string table. The strings are shared, not
+// copied, so each one is only parsed and stored once. This is done for the whole
+// context up front: it only holds what the block's JSX refers to, and components
+// get plain objects and arrays rather than proxies.
+function expandStrings(value, strings) {
+    if (Array.isArray(value)) {
+        for (let i = 0; i < value.length; i++) {
+            value[i] = expandStrings(value[i], strings)
+        }
+    } else if (value !== null && typeof value === 'object') {
+        let keys = Object.keys(value)
+        if (keys.length === 1 && keys[0] === '$s') {
+            // Either a reference, or a real {"$s": ...} object wrapped in a list
+            return Array.isArray(value.$s) ? {$s: expandStrings(value.$s[0], strings)}
+                                           : strings[value.$s]
+        }
+        keys.forEach(function(key) { value[key] = expandStrings(value[key], strings) })
+    }
+    return value
+}
 
-            // Extract serialized context data for rendering the component and get the component
-            // from our database
-            let ctx = JSON.parse(el.dataset.ctx)
-            let component = jsx_registry[el.dataset.sha1](COMPONENTS, ctx)
+function renderDjangoJSX(el, COMPONENTS) {
+    let sha1 = el.dataset.sha1
+    let name = 'django-jsx:' + sha1
+    let start = now()
+    if (perf && perf.mark) perf.mark(name + ':start')
 
-            // Actually render and place the component into the pgae:
-            // 1) Create a placeholder to render the component into
-            // 2) Render the component into the placeholder
-            // 3) Replace the placeholder with the actual component
-            // 4) Remove the <script> hook to clean up
+    try {
+        // Extract serialized context data for rendering the component and get the component
+        // from our database
+        if (!Object.hasOwnProperty.call(jsx_registry, sha1)) {
+            throw new Error('No JSX block ' + sha1 + ' in the registry, is it up to date?')
+        }
+        let ctx = JSON.parse(el.dataset.ctx)
+        if (el.dataset.strings) {
+            ctx = expandStrings(ctx, JSON.parse(el.dataset.strings))
+        }
+        let component = jsx_registry[sha1](COMPONENTS, ctx)
+
+        // Actually render and place the component into the pgae:
+        // 1) Create a placeholder to render the component into
+        // 2) Render the component into the placeholder
+        // 3) Replace the placeholder with the actual component
+        // 4) Remove the <script> hook to clean up
 
-            el.insertAdjacentHTML("afterend", "<span></span>")
+        el.insertAdjacentHTML("afterend", "<span></span>")
 
+        try {
             ReactDOM.render(component, el.nextSibling)
+        } catch (error) {
+            // Don't leave the placeholder behind
+            el.parentNode.removeChild(el.nextSibling)
+            throw error
+        }
 
-            el.parentNode.replaceChild(el.nextSibling.children[0], el.nextSibling)
-            el.parentNode.removeChild(el)
+        el.parentNode.replaceChild(el.nextSibling.children[0], el.nextSibling)
+        el.parentNode.removeChild(el)
+    } finally {
+        let elapsed = now() - start
+        if (perf && perf.mark && perf.measure) {
+            perf.mark(name + ':end')
+            perf.measure(name, name + ':start', name + ':end')
+            perf.clearMarks(name + ':start')
+            perf.clearMarks(name + ':end')
+        }
+        let timing = timings[sha1] || (timings[sha1] = {sha1: sha1, count: 0, total: 0, max: 0})
+        timing.count += 1
+        timing.total += elapsed
+        timing.max = Math.max(timing.max, elapsed)
+    }
+}
+
+function renderAllDjangoJSX(COMPONENTS) {
+    let errors = []
+    Array.prototype.forEach.call(
+        // Find all "django-jsx" scripts which are hooks to render and inject react components
+        document.querySelectorAll('script[type^=script][type$=django-jsx]'),
+        function(el) {
+            // One broken block shouldn't stop the rest of the page from rendering
+            try {
+                renderDjangoJSX(el, COMPONENTS)
+            } catch (error) {
+                errors.push({sha1: el.dataset.sha1, error: error})
+                console.error('Could not render JSX block ' + el.dataset.sha1, error)
+            }
         }
     )
+    let report = getDjangoJSXReport()
+    reportHooks.forEach(function(hook) {
+        // Nor should a broken monitoring hook stop the others, or the page
+        try {
+            hook(report, errors)
+        } catch (error) {
+            console.error('JSX report hook failed', error)
+        }
+    })
+    return errors
+}
+
+// The rendering time of every block rendered so far, slowest (in total) first
+function getDjangoJSXReport() {
+    return Object.keys(timings).map(function(sha1) {
+        return Object.assign({}, timings[sha1])
+    }).sort(function(a, b) { return b.total - a.total })
+}
+
+// Call hook(report, errors) each time renderAllDjangoJSX finishes, e.g. to send
+// the timings to a real-user monitoring service
+function onDjangoJSXReport(hook) {
+    reportHooks.push(hook)
 }
 
 jsx_registry.renderAllDjangoJSX = renderAllDjangoJSX;
+jsx_registry.getDjangoJSXReport = getDjangoJSXReport;
+jsx_registry.onDjangoJSXReport = onDjangoJSXReport;
 export default jsx_registry;
 """
 
@@ -64,77 +195,448 @@ class Command(BaseCommand):
             action='store',
             dest='output',
         )
+        parser.add_argument(
+            '--include',
+            action='append',
+            dest='include',
+            metavar='PATTERN',
+            help="Only look at templates whose path (relative to its template "
+                 "directory) matches this glob pattern. Can be repeated.",
+        )
+        parser.add_argument(
+            '--exclude',
+            action='append',
+            dest='exclude',
+            metavar='PATTERN',
+            help="Skip templates and directories whose path (relative to its "
+                 "template directory) matches this glob pattern, e.g. "
+                 "'*node_modules/*'. Can be repeated.",
+        )
+        parser.add_argument(
+            '--extension',
+            action='append',
+            dest='extensions',
+            metavar='EXT',
+            help="Only look at templates with this extension, e.g. '.html'. "
+                 "Can be repeated.",
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            dest='check',
+            help="Don't write anything, just exit with an error if the --output "
+                 "file (or --manifest) is missing or out of date.",
+        )
+        parser.add_argument(
+            '--manifest',
+            action='store',
+            dest='manifest',
+            metavar='FILE',
+            help="Also write a JSON file mapping the sha1 of each jsx block to the "
+                 "static asset that contains it, for JsxPreloadMiddleware.",
+        )
+        parser.add_argument(
+            '--manifest-asset',
+            action='store',
+            dest='manifest_asset',
+            metavar='PATH',
+            help="The path of the --output file as given to Django's static(), "
+                 "for the manifest. Defaults to the --output file's name.",
+        )
+        parser.add_argument(
+            '--components-index',
+            action='store',
+            dest='components_index',
+            metavar='FILE',
+            help="Also write a JSON file listing, for each element used in a jsx "
+                 "block, the templates and blocks that use it.",
+        )
+        parser.add_argument(
+            '--components-module',
+            action='store',
+            dest='components_module',
+            metavar='FILE',
+            help="Also write a JavaScript module importing just the components (from "
+                 "the JSX_COMPONENTS setting) that the jsx blocks use, to pass to "
+                 "renderAllDjangoJSX.",
+        )
+        parser.add_argument(
+            '--config',
+            action='store',
+            dest='config',
+            metavar='FILE',
+            help="Write several outputs in one run, as described by this JSON file: "
+                 "{\"outputs\": [{\"output\": ..., \"dirs\": [...], \"include\": [...], "
+                 "...}, ...]}. Each output takes the same options as the command line, "
+                 "plus \"dirs\" (template directories to use instead of Django's) and "
+                 "\"components\" (instead of the JSX_COMPONENTS setting).",
+        )
 
     def handle(self, *args, **kwargs):
-        output = None
-        if kwargs['output']:
-            output = open(kwargs['output'], 'w')
+        if kwargs.get('config'):
+            for option in OUTPUT_OPTIONS:
+                if kwargs.get(option):
+                    raise CommandError("Put %s in the --config file's outputs instead." % option)
+            outputs = load_config(kwargs['config'])
+        else:
+            outputs = [dict((option, kwargs.get(option)) for option in OUTPUT_OPTIONS)]
+
+        if not outputs[0]['output']:
+            if kwargs.get('check'):
+                raise CommandError("--check needs an --output file to check.")
+            if any(outputs[0].get(option) for option in OUTPUT_FILE_OPTIONS):
+                raise CommandError("--manifest and the like need an --output file.")
+            compile_templates(list_template_files(
+                include=outputs[0]['include'],
+                exclude=outputs[0]['exclude'],
+                extensions=outputs[0]['extensions'],
+            ), stderr=self.stderr)
+            return
+
+        # Templates are read and searched for blocks only once, however many
+        # outputs they're part of
+        index = {}
+        for options in outputs:
+            self.write_output(options, index, check=kwargs.get('check'))
+
+    def write_output(self, options, index, check=False):
+        """
+        Write the registry (and any other files) described by `options`, a dictionary
+        like the command's options.
+        :param index: A dictionary of the JsxBlocks found in each template so far,
+          shared between outputs.
+        """
+        template_files = list_template_files(
+            include=options.get('include'),
+            exclude=options.get('exclude'),
+            extensions=options.get('extensions'),
+            dirs=options.get('dirs'),
+        )
+
+        # Build everything in memory so the output files are only touched if they
+        # would actually change. Rewriting an identical file would still bump its
+        # mtime and make the frontend build start over.
+        output = io.StringIO()
+        blocks = compile_templates(template_files, output, index=index, stderr=self.stderr)
+        files = [(options['output'], output.getvalue().encode('utf-8'))]
+        if options.get('manifest'):
+            asset = options.get('manifest_asset') or os.path.basename(options['output'])
+            files.append((options['manifest'], build_manifest(blocks, asset)))
+        if options.get('components_index'):
+            files.append((options['components_index'], build_components_index(blocks)))
+        if options.get('components_module'):
+            component_modules = options.get('components')
+            if component_modules is None:
+                component_modules = getattr(settings, 'JSX_COMPONENTS', {})
+            for component in sorted(set(c for block in blocks for c in block.components)):
+                if component[0].isupper() and component not in component_modules:
+                    self.stderr.write("%s is used in a jsx block, but isn't in the "
+                                      "JSX_COMPONENTS setting or the config file's "
+                                      "components." % component)
+            files.append((options['components_module'],
+                          build_components_module(blocks, component_modules)))
+
+        for filename, content in files:
+            if check:
+                if not is_up_to_date(filename, content):
+                    raise CommandError("%s is out of date, run compilejsx to update it."
+                                       % filename)
+            else:
+                write_if_changed(filename, content)
+
+
+def load_config(filename):
+    """
+    Return the list of outputs described by the --config file `filename`, each a
+    dictionary with every one of OUTPUT_OPTIONS and CONFIG_OPTIONS.
+
+    Relative paths in it are used as they are, so relative to the current
+    directory, not to the config file.
+    """
+    try:
+        with open(filename) as f:
+            config = json.load(f)
+        outputs = config['outputs']
+    except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+        raise CommandError("Could not read the outputs from %s: %s" % (filename, e))
+    if not isinstance(outputs, list) or not outputs:
+        raise CommandError("%s should list at least one output." % filename)
+    result = []
+    for options in outputs:
+        if not isinstance(options, dict) or not options.get('output'):
+            raise CommandError("Every output in %s needs an \"output\" file." % filename)
+        unknown = set(options) - set(OUTPUT_OPTIONS) - set(CONFIG_OPTIONS)
+        if unknown:
+            raise CommandError("Unknown options for %s in %s: %s" % (
+                options['output'], filename, ', '.join(sorted(unknown))))
+        for option, value in options.items():
+            if value is None:
+                continue
+            if option in LIST_OPTIONS:
+                valid = isinstance(value, list) and all(
+                    isinstance(item, string_types) for item in value)
+                expected = "a list of strings"
+            elif option == 'components':
+                valid = isinstance(value, dict) and all(
+                    isinstance(item, string_types) for item in value.values())
+                expected = "an object mapping component names to modules"
+            else:
+                valid = isinstance(value, string_types)
+                expected = "a string"
+            if not valid:
+                raise CommandError("The %s option for %s in %s should be %s." % (
+                    option, options['output'], filename, expected))
+        result.append(dict(
+            [(option, None) for option in OUTPUT_OPTIONS + CONFIG_OPTIONS],
+            **options))
+    return result
+
+
+def matches_any(path, patterns):
+    return any(fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+
+def build_manifest(blocks, asset):
+    """
+    Return the content (bytes) of a manifest mapping the sha1 of each of the
+    `blocks` to `asset`, the static file they were compiled into.
+    """
+    manifest = dict((block.sha1, asset) for block in blocks)
+    return json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8') + b'\n'
+
+
+def build_components_index(blocks):
+    """
+    Return the content (bytes) of an index of which templates and blocks use
+    each component, e.g.
+    {"Dropdown": [{"template": "/.../form.html", "sha1": "..."}, ...], ...}
+    Lowercase elements (DOM tags like div) aren't components, and are left out.
+    """
+    index = {}
+    for block in blocks:
+        for component in block.components:
+            if not component[0].isupper():
+                continue
+            usage = {'template': block.template, 'sha1': block.sha1}
+            if usage not in index.setdefault(component, []):
+                index[component].append(usage)
+    return json.dumps(index, indent=2, sort_keys=True).encode('utf-8') + b'\n'
 
-        compile_templates(list_template_files(), output)
 
-        if output is not None:
-            output.close()
+def build_components_module(blocks, component_modules):
+    """
+    Return the content (bytes) of a JavaScript module whose default export is
+    an object with just the components the `blocks` use, for renderAllDjangoJSX.
+    Bundlers can then leave out every component that isn't used.
+    :param component_modules: A dictionary mapping component names to the module
+      they're the default export of, e.g. {"Dropdown": "./widgets/dropdown.js"}.
+      Use "module#name" for a named export instead.
+    """
+    used = sorted(set(c for block in blocks for c in block.components) & set(component_modules))
+    lines = ['/* Generated by compilejsx: the components used in jsx blocks. */']
+    for component in used:
+        module, _, export = component_modules[component].partition('#')
+        if export == component:
+            lines.append("import {%s} from '%s';" % (component, module))
+        elif export:
+            lines.append("import {%s as %s} from '%s';" % (export, component, module))
+        else:
+            lines.append("import %s from '%s';" % (component, module))
+    lines.append('')
+    lines.append('export default {')
+    lines.extend('    %s,' % component for component in used)
+    lines.append('};')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
 
 
-def list_template_files():
+def is_up_to_date(filename, content):
     """
-    Return list of template files everywhere Django looks for them.
+    Return True if the file `filename` exists and contains exactly `content` (bytes).
     """
-    engines = django.template.engines
+    try:
+        with open(filename, 'rb') as f:
+            existing = hashlib.sha1(f.read()).digest()
+    except (IOError, OSError):
+        return False
+    return existing == hashlib.sha1(content).digest()
+
 
-    template_dirs = []
-    # 'engines' is not a dictionary, it just behaves like one in some ways
-    for engine_name in engines:
-        engine = engines[engine_name]
-        if isinstance(engine, DjangoTemplates):
-            # We only handle Django templates
-            template_dirs.extend(engine.template_dirs)
+def write_if_changed(filename, content):
+    """
+    Replace the file `filename` with `content` (bytes), unless it already contains
+    exactly that.
+
+    The new content is written to a temporary file in the same directory which is
+    then renamed over the old one, so readers (and a crash part way through) never
+    see a partially written file.
+    :return: True if the file was written.
+    """
+    if is_up_to_date(filename, content):
+        return False
+    directory = os.path.dirname(os.path.abspath(filename))
+    (filehandle, temp_filename) = tempfile.mkstemp(
+        dir=directory, prefix='.%s.' % os.path.basename(filename), suffix='.tmp')
+    try:
+        with os.fdopen(filehandle, 'wb') as f:
+            f.write(content)
+        if os.path.exists(filename):
+            # mkstemp creates the file readable only by us, keep the old permissions
+            os.chmod(temp_filename, os.stat(filename).st_mode & 0o7777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_filename, 0o666 & ~umask)
+        getattr(os, 'replace', os.rename)(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
+    return True
+
+
+def list_template_files(include=None, exclude=None, extensions=None, dirs=None):
+    """
+    Generate the names of template files everywhere Django looks for them (or in
+    `dirs`, a list of directories, if given).
 
-    template_list = []
+    The patterns are matched against the path of each file relative to the
+    template directory it was found in, using "/" as the separator.
+    :param include: If given, a list of glob patterns; only files matching one
+      of them are generated.
+    :param exclude: A list of glob patterns for files to skip. Directories matching
+      one of them (with a trailing "/") are not descended into at all.
+    :param extensions: If given, a list of file extensions (e.g. ".html") to
+      limit the files to.
+    """
+    if dirs is not None:
+        template_dirs = dirs
+    else:
+        engines = django.template.engines
+        template_dirs = []
+        # 'engines' is not a dictionary, it just behaves like one in some ways
+        for engine_name in engines:
+            engine = engines[engine_name]
+            if isinstance(engine, DjangoTemplates):
+                # We only handle Django templates
+                template_dirs.extend(engine.template_dirs)
+
+    exclude = exclude or []
+    extensions = tuple(extensions) if extensions else None
     for each in template_dirs:
         for dir, dirnames, filenames in os.walk(each):
+            # Walk in a fixed order so the output is the same from run to run
+            dirnames.sort()
+            filenames.sort()
+            relative_dir = os.path.relpath(dir, each).replace(os.sep, '/')
+            relative_dir = '' if relative_dir == '.' else relative_dir + '/'
+            if exclude:
+                # Prune in place so os.walk doesn't descend into excluded directories
+                dirnames[:] = [
+                    dirname for dirname in dirnames
+                    if not matches_any(relative_dir + dirname + '/', exclude)
+                ]
             for filename in filenames:
-                template_list.append(os.path.join(dir, filename))
-    return template_list
+                if extensions and not filename.endswith(extensions):
+                    continue
+                relative_path = relative_dir + filename
+                if include and not matches_any(relative_path, include):
+                    continue
+                if matches_any(relative_path, exclude):
+                    continue
+                yield os.path.join(dir, filename)
+
+
+def read_template(filename, stderr=None):
+    """
+    Return the text of a template file if it might contain a JSX block, or None
+    if it can't (or can't be read, or isn't UTF-8 text).
+
+    The file is memory-mapped and checked for "{% jsx" before anything is decoded,
+    so large or binary files without JSX blocks cost next to nothing. A file that
+    has "{% jsx" in it but can't be decoded is skipped with a warning written to
+    `stderr` (sys.stderr by default), since its blocks won't be in the registry.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Can't mmap an empty file, and there's nothing in it anyway
+                return None
+            contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if not R_JSX_START.search(contents):
+                    return None
+                data = contents[:]
+            finally:
+                contents.close()
+    except (IOError, OSError, ValueError):
+        return None
+    if b'\0' in data:
+        # Binary file that happens to contain "{% jsx"
+        return None
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        (stderr or sys.stderr).write(
+            "Skipping %s, it has a jsx block but isn't UTF-8 text: %s\n" % (filename, e))
+        return None
+    # Translate newlines the way reading in text mode (and so Django's template
+    # loaders) would, so the sha1 of each block matches the one the tag computes.
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def find_blocks(template, stderr=None):
+    """
+    Return a list of the JsxBlocks in the template file `template`.
+    """
+    content = read_template(template, stderr)
+    if content is None:
+        return []
+    blocks = []
+    for jsx in re.findall(R_JSX, content):
+        hash = hashlib.sha1(jsx.encode('utf-8')).hexdigest()
+        # Sort for repeatable output, making for easier debugging and testing
+        components = sorted(set(re.findall(R_COMPONENT, jsx)))
+        blocks.append(JsxBlock(template, hash, jsx, components))
+    return blocks
 
 
-def compile_templates(template_list, output=None):
+def compile_templates(template_list, output=None, index=None, stderr=None):
     """
     Write a jsx_registry.js file to output (or stdout if output is None),
     containing boilerplate at top and bottom, and a jsx_registry entry for
     each jsx block found in any of the template files listed in `template_list`.
-    :param template_list: A list of template filenames.
+    :param template_list: An iterable of template filenames.
     :param output: A file-like object to write to, or None.
-    :return: nothing
+    :param index: An optional dictionary of the JsxBlocks in each template, used
+      instead of reading templates already in it and updated with the others.
+    :param stderr: A file-like object to write warnings to, or None for sys.stderr.
+    :return: A list of the JsxBlocks found, in the order they were written.
     """
+    blocks = []
     print(START_JS, file=output)
     for template in template_list:
-        first = True
-        try:
-            content = open(template).read()
-        except IOError:
-            pass
+        if index is None:
+            template_blocks = find_blocks(template, stderr)
+        elif template in index:
+            template_blocks = index[template]
         else:
-            jsx_blocks = re.findall(R_JSX, content)
-            for jsx in jsx_blocks:
-                if first:
-                    # Add comment indicating the template that these blocks came from.
-                    # Can help with debugging.
-                    first = False
-                    print('/* %s */' % template, file=output)
-                hash = hashlib.sha1(jsx.encode('utf-8')).hexdigest()
-
-                jsx = jsx.strip()
-                components = set(re.findall(R_COMPONENT, jsx))
-                component_statements = []
-                # Sort for repeatable output, making for easier debugging and testing
-                for component in sorted(components):
-                    component_statements.append(
-                        "if (Object.hasOwnProperty.call(COMPONENTS, '%(component)s')) "
-                        "var {%(component)s} = COMPONENTS;\n" % locals())
-                component_statements.append('return (%(jsx)s);' % locals())
-                component_statements = ''.join(component_statements)
-
-                print('jsx_registry["%(hash)s"] = '
-                      '(COMPONENTS, ctx) => {\n%(component_statements)s\n}' % locals(), file=output)
+            template_blocks = index[template] = find_blocks(template, stderr)
+        if template_blocks:
+            # Add comment indicating the template that these blocks came from.
+            # Can help with debugging.
+            print('/* %s */' % template, file=output)
+        for block in template_blocks:
+            blocks.append(block)
+            hash = block.sha1
+            jsx = block.jsx.strip()
+            component_statements = []
+            for component in block.components:
+                component_statements.append(
+                    "if (Object.hasOwnProperty.call(COMPONENTS, '%(component)s')) "
+                    "var {%(component)s} = COMPONENTS;\n" % locals())
+            component_statements.append('return (%(jsx)s);' % locals())
+            component_statements = ''.join(component_statements)
+
+            print('jsx_registry["%(hash)s"] = '
+                  '(COMPONENTS, ctx) => {\n%(component_statements)s\n}' % locals(), file=output)
     print(END_JS, file=output)
+    return blocks
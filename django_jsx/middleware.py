@@ -0,0 +1,118 @@
+import json
+import logging
+
+from django.conf import settings
+from django.templatetags.static import static
+
+logger = logging.getLogger(__name__)
+
+# Manifests loaded so far, by filename. See load_manifest. Shared by all threads
+# without a lock: a manifest is never changed once it's been added.
+_manifests = {}
+
+
+class JsxUsage(object):
+    """
+    Records the jsx blocks rendered while handling a request.
+
+    The `jsx` template tag adds each block it renders to the JsxUsage of the
+    request in the template context, if there is one (see get_usage).
+
+    If `digest` is set to a hashlib object (as jsx_etag does), it's also fed
+    the sha1 and serialized context of every block rendered, in order.
+    """
+    def __init__(self):
+        self.sha1s = []
+        self._seen = set()
+        self.digest = None
+
+    def add(self, sha1, payload=None):
+        if sha1 not in self._seen:
+            self._seen.add(sha1)
+            self.sha1s.append(sha1)
+        if self.digest is not None:
+            self.digest.update(sha1.encode('ascii'))
+            self.digest.update(b'\0')
+            self.digest.update((payload or '').encode('utf-8'))
+            self.digest.update(b'\0')
+
+
+def get_usage(request):
+    """
+    Return the JsxUsage for `request`, starting to record jsx blocks rendered
+    for it if we weren't already.
+    """
+    usage = getattr(request, 'jsx_usage', None)
+    if usage is None:
+        usage = request.jsx_usage = JsxUsage()
+    return usage
+
+
+def load_manifest(filename):
+    """
+    Return the manifest written by `compilejsx --manifest`, a dictionary mapping
+    the sha1 of each jsx block to the static asset containing it.
+
+    Each manifest is only read once per process. A missing or broken manifest
+    is logged and treated as empty, so it can't take the site down.
+    """
+    try:
+        return _manifests[filename]
+    except KeyError:
+        pass
+    try:
+        with open(filename) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        logger.exception("Could not load the jsx manifest %s", filename)
+        manifest = {}
+    # If another thread loaded it meanwhile, use the same one it did
+    return _manifests.setdefault(filename, manifest)
+
+
+def preload_links(sha1s, manifest, rel='preload'):
+    """
+    Return the values for a `Link` header preloading the assets that contain the
+    jsx blocks `sha1s`, in the order they were first needed.
+    """
+    links = []
+    for sha1 in sha1s:
+        asset = manifest.get(sha1)
+        if asset is None:
+            continue
+        if rel == 'preload':
+            link = '<%s>; rel=preload; as=script' % static(asset)
+        else:
+            link = '<%s>; rel=%s' % (static(asset), rel)
+        if link not in links:
+            links.append(link)
+    return links
+
+
+class JsxPreloadMiddleware(object):
+    """
+    Adds a `Link` header to responses that preloads the JavaScript assets
+    containing the jsx blocks the page used, so the browser can start fetching
+    them before it has even parsed the page.
+
+    Needs the `JSX_MANIFEST` setting to point at the manifest written by
+    `compilejsx --manifest`, and the `request` context processor so the
+    template tag can find the request. Set `JSX_PRELOAD_REL` to
+    "modulepreload" if the assets are ES modules.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        usage = get_usage(request)
+        response = self.get_response(request)
+        manifest_filename = getattr(settings, 'JSX_MANIFEST', None)
+        if usage.sha1s and manifest_filename:
+            links = preload_links(
+                usage.sha1s, load_manifest(manifest_filename),
+                rel=getattr(settings, 'JSX_PRELOAD_REL', 'preload'))
+            if links:
+                if response.has_header('Link'):
+                    links.insert(0, response['Link'])
+                response['Link'] = ', '.join(links)
+        return response
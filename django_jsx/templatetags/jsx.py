@@ -1,13 +1,17 @@
 import re
 import json
-from hashlib import sha1
 import logging
 
 from django import template, VERSION as dj_version
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.template import TemplateSyntaxError
 from django.utils.html import escape
 from django.template.base import Variable, VariableDoesNotExist
 
+from django_jsx.compiled import R_CTXEXPR, compile_jsx  # noqa: F401
+
 if dj_version[:2] >= (2, 1):
     from django.template.base import TokenType
     TOKEN_VAR = TokenType.VAR
@@ -15,13 +19,33 @@ if dj_version[:2] >= (2, 1):
 else:
     from django.template.base import TOKEN_VAR, TOKEN_BLOCK
 
-# Regex to find references to context that start with "ctx."
-# and look like "ctx.foo.bar" or "ctx.3.xyz" etc.
-R_CTXEXPR = re.compile(r'\.*ctx\.([A-Za-z][\d\w\.]*)')
+# Regex for one of the comma-separated names in a jsx tag's `fields` option,
+# e.g. "user.name" or "items.0.id"
+R_FIELD = re.compile(r'^[A-Za-z][\d\w]*(\.[\d\w]+)*$')
 
 logger = logging.getLogger(__name__)
 register = template.Library()
 
+# Shorter strings are never worth interning (see intern_strings)
+INTERN_MIN_LENGTH = 8
+
+# The escaped length of an interned string's {"$s": index} reference, not
+# counting the index, and of an empty data-strings attribute.
+REFERENCE_LENGTH = len(escape('{"$s": }'))
+STRING_TABLE_LENGTH = len(' data-strings="[]"')
+
+try:
+    string_types = (basestring,)  # noqa: F821 (Python 2)
+except NameError:
+    string_types = (str,)
+
+# The JSX_INTERN_STRINGS setting, looked up the first time a block is rendered
+# rather than for every block (see intern_all_strings)
+_intern_all_strings = None
+
+# Marks a context name without a usable value (see outside_loop_value)
+MISSING = object()
+
 
 def set_nested(dictionary, key, value):
     """
@@ -51,6 +75,113 @@ def set_nested(dictionary, key, value):
         set_nested(dictionary[elts[0]], new_key, value)
 
 
+def resolve_expression(context, expression, variable=None):
+    """
+    Resolve `expression` (e.g. "foo.bar") against the template context, falling
+    back to the engine's ``string_if_invalid`` the way Django templates do.
+    :param variable: An optional, already parsed ``Variable`` for `expression`.
+    """
+    try:
+        return (variable or Variable(expression)).resolve(context)
+    except VariableDoesNotExist:
+        logger.debug(
+            "JSX block refers to ctx.%s, but there's no variable by that name "
+            "in the Django template context.", expression)
+        if getattr(context, 'template', None):
+            string_if_invalid = context.template.engine.string_if_invalid
+        else:
+            string_if_invalid = ''
+        if '%s' in string_if_invalid:
+            return string_if_invalid % expression
+        return string_if_invalid
+
+
+def intern_all_strings():
+    """Return the JSX_INTERN_STRINGS setting, which turns on interning for every block."""
+    global _intern_all_strings
+    intern_all = _intern_all_strings
+    if intern_all is None:
+        intern_all = _intern_all_strings = bool(getattr(settings, 'JSX_INTERN_STRINGS', False))
+    return intern_all
+
+
+@receiver(setting_changed)
+def reset_settings(setting, **kwargs):
+    """Forget the settings looked up so far when one of them is changed."""
+    global _intern_all_strings
+    if setting == 'JSX_INTERN_STRINGS':
+        _intern_all_strings = None
+
+
+def intern_strings(value, min_length=INTERN_MIN_LENGTH):
+    """
+    Return a copy of `value` (made of dicts, lists and other values) in which
+    strings that occur more than once are replaced by ``{"$s": index}``, and the
+    list of those strings, the string table those are indexes into.
+
+    A string is only interned if that makes the escaped output shorter, counting
+    its references and its entry in the table, and nothing is interned unless
+    that saves more than the cost of the data-strings attribute. So interning
+    never makes a block bigger; if it wouldn't help, `value` is returned as is,
+    with an empty table. Strings shorter than `min_length` aren't even considered.
+
+    A dict that really has just a "$s" key is wrapped as ``{"$s": [value]}`` so
+    it can't be mistaken for a reference. The runtime compilejsx generates
+    undoes all this when it reads the context.
+    """
+    counts = {}
+    lookalikes = [0]
+
+    def count(value):
+        if isinstance(value, dict):
+            if list(value) == ['$s']:
+                lookalikes[0] += 1
+            for item in value.values():
+                count(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                count(item)
+        elif isinstance(value, string_types) and len(value) >= min_length:
+            counts[value] = counts.get(value, 0) + 1
+
+    count(value)
+
+    # The index of every reference is at most this many digits long
+    reference_length = REFERENCE_LENGTH + len(str(len(counts)))
+    interned = set()
+    saved = 0
+    for string, occurrences in counts.items():
+        # The string is written once in the table, with a ", " separator
+        length = len(escape(json.dumps(string)))
+        saving = (occurrences - 1) * length - occurrences * reference_length - 2
+        if saving > 0:
+            interned.add(string)
+            saved += saving
+    # Wrapping a lookalike dict adds "[" and "]"
+    if saved <= STRING_TABLE_LENGTH + 2 * lookalikes[0]:
+        return value, []
+
+    strings = []
+    indexes = {}
+
+    def replace(value):
+        if isinstance(value, dict):
+            replaced = dict((key, replace(item)) for key, item in value.items())
+            if list(replaced) == ['$s']:
+                replaced = {'$s': [replaced['$s']]}
+            return replaced
+        if isinstance(value, (list, tuple)):
+            return [replace(item) for item in value]
+        if isinstance(value, string_types) and value in interned:
+            if value not in indexes:
+                indexes[value] = len(strings)
+                strings.append(value)
+            return {'$s': indexes[value]}
+        return value
+
+    return replace(value), strings
+
+
 def serialize_opportunistically(context, expressions):
     """
     :param context: A template context
@@ -61,25 +192,65 @@ def serialize_opportunistically(context, expressions):
     """
     ctx = {}
     for expression in expressions:
-        try:
-            value = Variable(expression).resolve(context)
-        except VariableDoesNotExist:
-            logger.debug(
-                "JSX block refers to ctx.%s, but there's no variable by that name "
-                "in the Django template context.", expression)
-            if context.template:
-                string_if_invalid = context.template.engine.string_if_invalid
-            else:
-                string_if_invalid = ''
-            if '%s' in string_if_invalid:
-                value = string_if_invalid % expression
-            else:
-                value = string_if_invalid
-        set_nested(ctx, expression, value)
+        set_nested(ctx, expression, resolve_expression(context, expression))
     ctx = json.dumps(ctx)
     return ctx
 
 
+def find_loop_depth(context):
+    """
+    Return the index in ``context.dicts`` of the layer pushed by the innermost
+    enclosing ``{% for %}`` loop, or None if we're not inside a loop.
+    """
+    dicts = getattr(context, 'dicts', ())
+    for depth in range(len(dicts) - 1, -1, -1):
+        if 'forloop' in dicts[depth]:
+            return depth
+    return None
+
+
+def outside_loop_value(context, name, loop_depth):
+    """
+    Return the value of `name` if it's defined in the context only below the
+    layer the innermost loop pushed, or MISSING if it's set inside the loop or
+    not at all.
+    """
+    for depth in range(len(context.dicts) - 1, -1, -1):
+        if name in context.dicts[depth]:
+            if depth < loop_depth:
+                return context.dicts[depth][name]
+            return MISSING
+    # Missing variables are cheap to resolve, don't bother caching them.
+    return MISSING
+
+
+def is_plain_data(value, expressions):
+    """
+    True if resolving each of `expressions` (pairs of expression and Variable)
+    from `value`, the value of their first name, only looks up items in dicts,
+    lists and tuples and ends up at something that isn't callable, so it can't
+    run any code or give a different result next time.
+    """
+    for expression, variable in expressions:
+        current = value
+        for bit in variable.lookups[1:]:
+            if isinstance(current, dict):
+                if bit not in current:
+                    # Django would go on to look for an attribute, e.g. dict.items
+                    return False
+                current = current[bit]
+            elif isinstance(current, (list, tuple)):
+                try:
+                    current = current[int(bit)]
+                except (ValueError, IndexError):
+                    return False
+            else:
+                return False
+        if callable(current):
+            return False
+    return True
+
+
 @register.tag
 def jsx(parser, token):
     """
@@ -108,8 +279,43 @@ def jsx(parser, token):
     data-ctx) A serialized copy of the contents of the template context
     at the point where this block was, filtered to the bits that are referred
     to in the JSX.
+
+    By default the bits of the context that get serialized are found by
+    looking for "ctx.something" in the JSX. To say exactly which ones the
+    block needs instead, list them in the `fields` option:
+
+        {% jsx fields="user.name,user.id" %}
+
+    Only those values are serialized, no matter what the JSX refers to.
+
+    For blocks whose context repeats the same long strings over and over
+    (labels, URLs, class names in a big list), add `intern`:
+
+        {% jsx intern %}
+
+    Each repeated string is then serialized once, in a data-strings attribute,
+    and referred to by its index in data-ctx. The JSX_INTERN_STRINGS setting
+    does this for every block.
     """
 
+    fields = None
+    intern = False
+    for bit in token.split_contents()[1:]:
+        if bit == 'intern':
+            intern = True
+            continue
+        name, _, value = bit.partition('=')
+        if name != 'fields' or len(value) < 2 or value[0] not in '"\'' or value[-1] != value[0]:
+            raise TemplateSyntaxError(
+                "jsx tag only accepts `intern` and a quoted fields option, e.g. "
+                "{%% jsx fields=\"user.name,user.id\" %%}, not %r" % bit)
+        fields = [field.strip() for field in value[1:-1].split(',') if field.strip()]
+        for field in fields:
+            if not R_FIELD.match(field):
+                raise TemplateSyntaxError(
+                    "%r is not a valid field for a jsx block, expected something "
+                    "like \"user.name\"" % field)
+
     text = []
 
     while parser.tokens:
@@ -118,7 +324,8 @@ def jsx(parser, token):
         if token.contents == 'endjsx':
             break
 
-        if token.contents == 'jsx':
+        if token.contents == 'jsx' or (
+                token.token_type == TOKEN_BLOCK and token.contents.startswith('jsx ')):
             raise TemplateSyntaxError("jsx blocks cannot be nested in a template")
 
         if token.token_type == TOKEN_VAR:
@@ -133,15 +340,100 @@ def jsx(parser, token):
         elif token.token_type == TOKEN_BLOCK:
             text.append('%}')
 
-    return JsxNode(''.join(text))
+    return JsxNode(''.join(text), fields=fields, intern=intern)
 
 
 class JsxNode(template.Node):
-    def __init__(self, jsx):
+    """
+    Everything that only depends on the text of the block (its sha1, the
+    ``ctx.`` expressions it refers to and their parsed ``Variable``) is worked
+    out once, when the template is parsed, rather than on every render. See
+    django_jsx.compiled.
+
+    If `fields` is given, it's the list of expressions to serialize instead
+    of the ones found in the JSX. If `intern` is true, repeated strings in the
+    serialized context are interned (see intern_strings).
+
+    Like every template node, one JsxNode is shared by all the threads rendering
+    its template at the same time, so it never changes after it's been created:
+    its attributes are set in __init__ (and the CompiledJsx is immutable), and
+    anything a render needs to remember, like the loop-invariant fragments, is
+    kept in that render's ``context.render_context`` instead.
+    """
+    def __init__(self, jsx, fields=None, intern=False):
         self.jsx = jsx
+        self.compiled = compile_jsx(jsx, fields)
+        self.intern = intern
+
+    def serialize_group(self, context, name, expressions):
+        """
+        Return the escaped JSON for the `name` key of the serialized context,
+        e.g. ``&quot;foo&quot;: {&quot;bar&quot;: 1}``.
+        """
+        ctx = {}
+        for expression, variable in expressions:
+            set_nested(ctx, expression, resolve_expression(context, expression, variable))
+        return escape('%s: %s' % (json.dumps(name), json.dumps(ctx[name])))
+
+    def render_interned(self, context):
+        """
+        Return the escaped serialized context, and the escaped string table of
+        the strings interned from it, or None if there weren't any.
+        """
+        ctx = {}
+        for name, expressions in self.compiled.groups:
+            for expression, variable in expressions:
+                set_nested(ctx, expression, resolve_expression(context, expression, variable))
+        ctx, strings = intern_strings(ctx)
+        return escape(json.dumps(ctx)), escape(json.dumps(strings)) if strings else None
 
     def render(self, context):
-        expressions = re.findall(R_CTXEXPR, self.jsx)
-        ctx = serialize_opportunistically(context, expressions)
-        return '<script type="script/django-jsx" data-sha1="%s" data-ctx="%s"></script>' % \
-               (sha1(self.jsx.encode('utf-8')).hexdigest(), escape(ctx))
+        compiled = self.compiled
+        if self.intern or intern_all_strings():
+            payload, strings = self.render_interned(context)
+            self.record_usage(context, payload + (strings or ''))
+            if strings is None:
+                return ''.join([compiled.prefix, payload, compiled.suffix])
+            return ''.join([compiled.prefix, payload, '" data-strings="', strings,
+                            compiled.suffix])
+
+        # Inside a {% for %} loop, the parts of the context that come from outside
+        # the loop are usually the same on every iteration, so we serialize those
+        # once per loop and keep them in the render context. They're only reused
+        # while the name still refers to the very same object (tags like
+        # {% cycle %} can replace it from inside the loop), and only if resolving
+        # them is plain data lookups, with no callables or attributes that could
+        # give something different next time. Everything else, including the
+        # loop variables, is serialized again on each iteration.
+        loop_depth = find_loop_depth(context) if compiled.groups else None
+        if loop_depth is None:
+            cache = None
+        else:
+            forloop = context.dicts[loop_depth]['forloop']
+            cached_loop, cache = context.render_context.get(self, (None, None))
+            if cached_loop is not forloop:
+                cache = {}
+                context.render_context[self] = (forloop, cache)
+
+        fragments = []
+        for name, expressions in compiled.groups:
+            value = MISSING
+            if cache is not None:
+                value = outside_loop_value(context, name, loop_depth)
+                cached_value, fragment = cache.get(name, (MISSING, None))
+                if value is not MISSING and value is cached_value:
+                    fragments.append(fragment)
+                    continue
+            fragment = self.serialize_group(context, name, expressions)
+            if value is not MISSING and is_plain_data(value, expressions):
+                cache[name] = (value, fragment)
+            fragments.append(fragment)
+        payload = '{%s}' % ', '.join(fragments)
+        self.record_usage(context, payload)
+        return ''.join([compiled.prefix, payload, compiled.suffix])
+
+    def record_usage(self, context, payload):
+        # Let JsxPreloadMiddleware and jsx_etag know the page uses this block
+        usage = getattr(context.get('request'), 'jsx_usage', None)
+        if usage is not None:
+            usage.add(self.compiled.sha1, payload)
@@ -0,0 +1,37 @@
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.test import TestCase
+
+from django_jsx import compiled
+from django_jsx.compiled import compile_jsx
+
+
+class CompiledJsxTest(TestCase):
+    def setUp(self):
+        self.addCleanup(compiled._compiled.clear)
+
+    def test_compiled_block(self):
+        jsx = '<Component a={ctx.foo.bar} b={ctx.baz} c={ctx.foo.qux}/>'
+        block = compile_jsx(jsx)
+        self.assertEqual(hashlib.sha1(jsx.encode('utf-8')).hexdigest(), block.sha1)
+        self.assertEqual(('foo.bar', 'baz', 'foo.qux'), block.expressions)
+        self.assertEqual(
+            [('foo', ['foo.bar', 'foo.qux']), ('baz', ['baz'])],
+            [(name, [expression for expression, variable in group])
+             for name, group in block.groups])
+
+    def test_immutable(self):
+        block = compile_jsx('<Component/>')
+        with self.assertRaises(AttributeError):
+            block.sha1 = 'abc'
+        with self.assertRaises(AttributeError):
+            block.other = 'abc'
+
+    def test_identical_blocks_are_shared(self):
+        self.assertIs(compile_jsx('<Component/>'), compile_jsx('<Component/>'))
+        # ... unless they declare their own fields
+        block = compile_jsx('<Component/>', fields=['foo'])
+        self.assertEqual(compile_jsx('<Component/>').sha1, block.sha1)
+        self.assertEqual(('foo',), block.expressions)
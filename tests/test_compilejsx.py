@@ -2,14 +2,48 @@ from __future__ import unicode_literals
 
 import hashlib
 import io
+import json
 import os
+import subprocess
 import sys
 import tempfile
+from unittest import skipUnless
 
-from django.core.management import call_command
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
 
-from django_jsx.management.commands.compilejsx import compile_templates, END_JS, START_JS
+from django_jsx.management.commands.compilejsx import (
+    build_components_module, compile_templates, JsxBlock, END_JS, START_JS)
+
+
+def find_node():
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        filename = os.path.join(directory, 'node')
+        if os.path.isfile(filename) and os.access(filename, os.X_OK):
+            return filename
+    return None
+
+
+NODE = find_node()
+
+# Runs END_JS in node with just enough of a DOM for blocks that fail to render,
+# and two report hooks, the first of which throws
+RUNTIME_TEST_JS = """
+var jsx_registry = {};
+var console = {error: function() {}};
+var blocks = [{dataset: {sha1: 'missing1', ctx: '{}'}}, {dataset: {sha1: 'missing2', ctx: '{}'}}];
+var document = {querySelectorAll: function() { return blocks }};
+var hookCalls = [];
+%s
+jsx_registry.onDjangoJSXReport(function() { throw new Error('broken hook') });
+jsx_registry.onDjangoJSXReport(function(report, errors) {
+    hookCalls.push({report: report.length, errors: errors.length});
+});
+var errors = jsx_registry.renderAllDjangoJSX({});
+process.stdout.write(JSON.stringify({
+    errors: errors.map(function(e) { return e.sha1 }), hookCalls: hookCalls}));
+"""
 
 
 class CompileJSXTest(TestCase):
@@ -58,6 +92,209 @@ class CompileJSXTest(TestCase):
         output = open(filename, "rb").read().decode('utf-8')
         self.assertIn(START_JS, output)
 
+    def test_unchanged_output_file_is_not_rewritten(self):
+        # If the registry hasn't changed, the output file is left alone
+        filename = type(self).make_testfile()
+        call_command('compilejsx', output=filename)
+        os.utime(filename, (0, 0))
+        call_command('compilejsx', output=filename)
+        self.assertEqual(0, os.stat(filename).st_mtime)
+
+    def test_changed_output_file_is_replaced(self):
+        filename = type(self).make_testfile()
+        with open(filename, "w") as f:
+            f.write("stale")
+        call_command('compilejsx', output=filename)
+        output = open(filename, "rb").read().decode('utf-8')
+        self.assertTrue(output.startswith(START_JS))
+        self.assertNotIn("stale", output)
+        # No temporary files left behind
+        directory, basename = os.path.split(filename)
+        self.assertEqual([], [fn for fn in os.listdir(directory)
+                              if fn.startswith('.%s.' % basename)])
+
+    def test_check(self):
+        # --check fails if the output file is out of date, and doesn't touch it
+        filename = type(self).make_testfile()
+        with self.assertRaises(CommandError):
+            call_command('compilejsx', output=filename, check=True)
+        self.assertEqual(b"", open(filename, "rb").read())
+        # ... and passes once it's up to date
+        call_command('compilejsx', output=filename)
+        call_command('compilejsx', output=filename, check=True)
+
+    def test_check_needs_output(self):
+        with self.assertRaises(CommandError):
+            call_command('compilejsx', check=True)
+
+    def make_template_dir(self, templates):
+        """
+        Make a template directory containing `templates`, a dictionary of template
+        names and contents, and return its name.
+        """
+        template_dir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, template_dir)
+        for name, content in templates.items():
+            template = os.path.join(template_dir, name)
+            with open(template, "w") as f:
+                f.write(content)
+            self.addCleanup(os.remove, template)
+        return template_dir
+
+    def template_dir_settings(self, templates):
+        """
+        Make a template directory containing `templates`, and return settings
+        that make it the only one.
+        """
+        return override_settings(TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': [self.make_template_dir(templates)],
+        }])
+
+    def test_manifest(self):
+        # --manifest maps the sha1 of every block to the registry asset
+        filename = type(self).make_testfile()
+        manifest = type(self).make_testfile()
+        with self.template_dir_settings({
+                "template.html": "{% jsx %}<One/>{% endjsx %}{% jsx %}<Two/>{% endjsx %}"}):
+            call_command('compilejsx', output=filename, manifest=manifest)
+            self.assertEqual({
+                hashlib.sha1(b'<One/>').hexdigest(): os.path.basename(filename),
+                hashlib.sha1(b'<Two/>').hexdigest(): os.path.basename(filename),
+            }, json.load(open(manifest)))
+            call_command('compilejsx', output=filename, manifest=manifest,
+                         manifest_asset='js/jsx_registry.js')
+            self.assertEqual({'js/jsx_registry.js'}, set(json.load(open(manifest)).values()))
+            call_command('compilejsx', output=filename, manifest=manifest,
+                         manifest_asset='js/jsx_registry.js', check=True)
+
+    def test_components_index_and_module(self):
+        # --components-index lists where each component is used, and --components-module
+        # imports just the components that are used
+        filename = type(self).make_testfile()
+        index = type(self).make_testfile()
+        module = type(self).make_testfile()
+        one = '<div><Dropdown/><Calendar/></div>'
+        two = '<Dropdown/>'
+        stderr = io.StringIO()
+        with self.template_dir_settings({
+                "a.html": "{% jsx %}" + one + "{% endjsx %}",
+                "b.html": "{% jsx %}" + two + "{% endjsx %}"}):
+            with override_settings(JSX_COMPONENTS={
+                    'Dropdown': './widgets/dropdown.js',
+                    'Loading': './widgets/loading.js',
+                    'Calendar': './widgets/index.js#Calendar'}):
+                call_command('compilejsx', output=filename, components_index=index,
+                             components_module=module, stderr=stderr)
+            call_command('compilejsx', output=filename, components_module=module,
+                         stderr=stderr)
+            template_dir = settings.TEMPLATES[0]['DIRS'][0]
+        self.assertEqual({
+            'Calendar': [{'template': os.path.join(template_dir, 'a.html'),
+                          'sha1': hashlib.sha1(one.encode('utf-8')).hexdigest()}],
+            'Dropdown': [{'template': os.path.join(template_dir, 'a.html'),
+                          'sha1': hashlib.sha1(one.encode('utf-8')).hexdigest()},
+                         {'template': os.path.join(template_dir, 'b.html'),
+                          'sha1': hashlib.sha1(two.encode('utf-8')).hexdigest()}],
+        }, json.load(open(index)))
+        # The second run had no JSX_COMPONENTS, so there's nothing to import
+        self.assertNotIn('import', open(module).read())
+        self.assertIn("Calendar is used in a jsx block, but isn't in the JSX_COMPONENTS setting",
+                      stderr.getvalue())
+
+    def test_components_module(self):
+        blocks = [
+            JsxBlock('a.html', 'abc', '', ['Dropdown', 'div']),
+            JsxBlock('b.html', 'def', '', ['Calendar', 'Dropdown', 'Picker']),
+        ]
+        self.assertEqual(
+            "/* Generated by compilejsx: the components used in jsx blocks. */\n"
+            "import {Calendar} from './widgets/index.js';\n"
+            "import Dropdown from './widgets/dropdown.js';\n"
+            "import {DatePicker as Picker} from './widgets/index.js';\n"
+            "\n"
+            "export default {\n"
+            "    Calendar,\n"
+            "    Dropdown,\n"
+            "    Picker,\n"
+            "};\n",
+            build_components_module(blocks, {
+                'Dropdown': './widgets/dropdown.js',
+                'Loading': './widgets/loading.js',
+                'Calendar': './widgets/index.js#Calendar',
+                'Picker': './widgets/index.js#DatePicker'}).decode('utf-8'))
+
+    def test_manifest_needs_output(self):
+        with self.assertRaises(CommandError):
+            call_command('compilejsx', manifest='manifest.json')
+
+    def test_config(self):
+        # --config writes several outputs, each from its own templates
+        template_dir = self.make_template_dir({
+            "a.html": "{% jsx %}<SiteA/>{% endjsx %}",
+            "b.html": "{% jsx %}<SiteB/>{% endjsx %}"})
+        shared = self.make_template_dir({"shared.html": "{% jsx %}<Shared/>{% endjsx %}"})
+
+        site_a = type(self).make_testfile()
+        site_b = type(self).make_testfile()
+        module_b = type(self).make_testfile()
+        config = type(self).make_testfile()
+        with open(config, "w") as f:
+            json.dump({"outputs": [
+                {"output": site_a, "dirs": [template_dir, shared], "include": ["a.html", "s*"]},
+                {"output": site_b, "dirs": [template_dir, shared], "exclude": ["a.html"],
+                 "components_module": module_b, "components": {"SiteB": "./b.js"}},
+            ]}, f)
+        stderr = io.StringIO()
+        call_command('compilejsx', config=config, stderr=stderr)
+
+        site_a_js = open(site_a).read()
+        self.assertIn(hashlib.sha1(b'<SiteA/>').hexdigest(), site_a_js)
+        self.assertIn(hashlib.sha1(b'<Shared/>').hexdigest(), site_a_js)
+        self.assertNotIn(hashlib.sha1(b'<SiteB/>').hexdigest(), site_a_js)
+        site_b_js = open(site_b).read()
+        self.assertNotIn(hashlib.sha1(b'<SiteA/>').hexdigest(), site_b_js)
+        self.assertIn(hashlib.sha1(b'<Shared/>').hexdigest(), site_b_js)
+        self.assertIn(hashlib.sha1(b'<SiteB/>').hexdigest(), site_b_js)
+        self.assertIn("import SiteB from './b.js';", open(module_b).read())
+        # Shared isn't in the config file's components
+        self.assertEqual(
+            "Shared is used in a jsx block, but isn't in the JSX_COMPONENTS setting or "
+            "the config file's components.\n", stderr.getvalue())
+
+        call_command('compilejsx', config=config, check=True, stderr=io.StringIO())
+
+    def test_bad_config(self):
+        config = type(self).make_testfile()
+        for content in ['', '{}', '{"outputs": []}', '{"outputs": [{"include": ["*"]}]}',
+                        '{"outputs": [{"output": "x.js", "colour": "blue"}]}',
+                        '{"outputs": [{"output": "x.js", "include": "a.html"}]}',
+                        '{"outputs": [{"output": "x.js", "exclude": "a.html"}]}',
+                        '{"outputs": [{"output": "x.js", "extensions": ".html"}]}',
+                        '{"outputs": [{"output": "x.js", "dirs": "templates"}]}',
+                        '{"outputs": [{"output": "x.js", "dirs": [1]}]}',
+                        '{"outputs": [{"output": "x.js", "components": ["A"]}]}',
+                        '{"outputs": [{"output": ["x.js"]}]}']:
+            with open(config, "w") as f:
+                f.write(content)
+            with self.assertRaises(CommandError):
+                call_command('compilejsx', config=config)
+        # Output options go in the config file, not on the command line
+        with self.assertRaises(CommandError):
+            call_command('compilejsx', config=config, output='x.js')
+
+    def test_templates_are_read_once(self):
+        # With an index, a template is only read the first time it's compiled
+        filename = type(self).make_testfile()
+        with open(filename, "w") as f:
+            f.write("{% jsx %}<Component/>{% endjsx %}")
+        index = {}
+        first = compile_templates([filename], io.StringIO(), index=index)
+        with open(filename, "w") as f:
+            f.write("")
+        self.assertEqual(first, compile_templates([filename], io.StringIO(), index=index))
+        self.assertEqual([], compile_templates([filename], io.StringIO()))
+
     def try_it(self, test_content, expected_result, raw=False):
         # Make template file containing a jsx block whose body is `test_content`, run
         # compilejsx, and make sure the output is `expected_result`.  Or if `raw` is true,
@@ -103,6 +340,60 @@ class CompileJSXTest(TestCase):
         result = output.getvalue()[start:end - 1]
         self.assertEqual('', result)
 
+    def test_templates_without_jsx_or_text_are_skipped(self):
+        # Files that don't contain a jsx block, or aren't UTF-8 text, contribute nothing
+        not_jsx = type(self).make_testfile()
+        with open(not_jsx, "w") as f:
+            f.write("{% load jsx %}<p>No blocks here</p>")
+        binary = type(self).make_testfile()
+        with open(binary, "wb") as f:
+            f.write(b"\x89PNG\0{% jsx %}<Component/>{% endjsx %}\xff")
+        output = io.StringIO()
+        compile_templates(iter([not_jsx, binary, "/no/such/template.html"]), output)
+        self.assertEqual(START_JS + "\n" + END_JS + "\n", output.getvalue())
+
+    def test_runtime(self):
+        # The runtime exports its API, and renders (and reports on) each block on its own
+        for name in ['renderAllDjangoJSX', 'getDjangoJSXReport', 'onDjangoJSXReport']:
+            self.assertIn('jsx_registry.%s = %s;' % (name, name), END_JS)
+        self.assertIn('try {\n                renderDjangoJSX(el, COMPONENTS)', END_JS)
+        self.assertIn('try {\n            hook(report, errors)', END_JS)
+
+    @skipUnless(NODE, "needs node")
+    def test_runtime_isolates_failures(self):
+        script = RUNTIME_TEST_JS % END_JS.replace('export default jsx_registry;', '')
+        process = subprocess.Popen([NODE], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        stdout, _ = process.communicate(script.encode('utf-8'))
+        self.assertEqual(0, process.returncode)
+        self.assertEqual({
+            'errors': ['missing1', 'missing2'],
+            'hookCalls': [{'report': 2, 'errors': 2}],
+        }, json.loads(stdout.decode('utf-8')))
+
+    def test_templates_not_in_utf8_are_reported(self):
+        # A template with a jsx block that can't be decoded is skipped with a warning
+        latin1 = type(self).make_testfile()
+        with open(latin1, "wb") as f:
+            f.write("{% jsx %}<Component title='Café'/>{% endjsx %}".encode('latin-1'))
+        output = io.StringIO()
+        stderr = io.StringIO()
+        compile_templates([latin1], output, stderr=stderr)
+        self.assertEqual(START_JS + "\n" + END_JS + "\n", output.getvalue())
+        self.assertIn("Skipping %s, it has a jsx block but isn't UTF-8 text" % latin1,
+                      stderr.getvalue())
+
+    def test_windows_newlines(self):
+        # Newlines are translated the way Django's template loaders do, so the
+        # sha1 matches the one the template tag computes.
+        test_content = '<Component\r\n  foo="bar"/>'
+        sha1 = hashlib.sha1(test_content.replace('\r\n', '\n').encode('utf-8')).hexdigest()
+        filename = type(self).make_testfile()
+        with open(filename, "wb") as f:
+            f.write(("{% jsx %}" + test_content + "{% endjsx %}").encode('utf-8'))
+        output = io.StringIO()
+        compile_templates([filename], output)
+        self.assertIn('jsx_registry["%s"]' % sha1, output.getvalue())
+
     def test_template_with_empty_jsx_block(self):
         # If the block is empty, the output is pretty minimal
 
@@ -192,6 +483,20 @@ return (%s);
 }''' % (sha1, test_content)  # noqa (long line hard to avoid here)
         self.try_it(test_content, expected)
 
+    def test_block_with_options(self):
+        # Options on the jsx tag don't change the output
+        test_content = '<Component foo={ctx.user.name}/>'
+        sha1 = hashlib.sha1(test_content.encode('utf-8')).hexdigest()
+        expected = '''/* {filename} */
+jsx_registry["%s"] = (COMPONENTS, ctx) => {
+if (Object.hasOwnProperty.call(COMPONENTS, 'Component')) var {Component} = COMPONENTS;
+return (%s);
+}''' % (sha1, test_content)
+        self.try_it('{% jsx fields="user.name" %}' + test_content + '{% endjsx %}',
+                    expected, raw=True)
+        self.try_it('{% jsx intern fields="user.name" %}' + test_content + '{% endjsx %}',
+                    expected, raw=True)
+
     def test_duplicate_blocks_with_different_contexts(self):
         # compilejsx comes up with the same jsx_registry entry repeatedly if there are multiple
         # blocks with the same content but with different contexts.  But this is okay, as
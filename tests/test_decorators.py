@@ -0,0 +1,119 @@
+from __future__ import unicode_literals
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.template import Context, Engine, engines
+from django.template.response import TemplateResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from django_jsx.decorators import jsx_etag
+
+
+SOURCE = '{% load jsx %}<h1>Static</h1>{% jsx %}<Greeting name={ctx.name}/>{% endjsx %}'
+TEMPLATE = Engine.get_default().from_string(SOURCE)
+
+# Just the context processor the decorator needs
+REQUEST_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {'context_processors': ['django.template.context_processors.request']},
+}]
+
+
+def render(request, name):
+    # Passing the request is what the `request` context processor would do
+    return HttpResponse(TEMPLATE.render(Context({'request': request, 'name': name})))
+
+
+def make_view(name, **kwargs):
+    @jsx_etag(**kwargs)
+    def view(request):
+        return render(request, name)
+    return view
+
+
+@override_settings(JSX_ETAG_VERSION='1')
+class JsxEtagTest(TestCase):
+    def get(self, view, etag=None, method='get'):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return view(getattr(RequestFactory(), method)('/', **headers))
+
+    def test_etag(self):
+        # Same context -> same ETag, different context -> different ETag
+        etag = self.get(make_view('Ann'))['ETag']
+        self.assertEqual(etag, self.get(make_view('Ann'))['ETag'])
+        self.assertNotEqual(etag, self.get(make_view('Bob'))['ETag'])
+
+    def test_not_modified(self):
+        view = make_view('Ann')
+        etag = self.get(view)['ETag']
+        response = self.get(view, etag=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.content)
+        self.assertEqual(304, self.get(view, etag=etag, method='head').status_code)
+        # Once the context changes, the page is sent again
+        response = self.get(make_view('Bob'), etag=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'Bob', response.content)
+
+    def test_version(self):
+        etag = self.get(make_view('Ann'))['ETag']
+        self.assertNotEqual(etag, self.get(make_view('Ann', version='2'))['ETag'])
+        with override_settings(JSX_ETAG_VERSION='2'):
+            self.assertEqual(self.get(make_view('Ann', version='2'))['ETag'],
+                             self.get(make_view('Ann'))['ETag'])
+
+    def test_version_is_required(self):
+        # Without a version, template changes would be hidden behind old ETags
+        with override_settings(JSX_ETAG_VERSION=None):
+            with self.assertRaises(ImproperlyConfigured):
+                self.get(make_view('Ann'))
+            self.assertTrue(self.get(make_view('Ann', version='2')).has_header('ETag'))
+
+    @override_settings(TEMPLATES=REQUEST_TEMPLATES)
+    def test_template_response(self):
+        # TemplateResponses are left for Django to render, and get their ETag then,
+        # so changes made by process_template_response middleware count
+        @jsx_etag
+        def view(request):
+            return TemplateResponse(request, engines['django'].from_string(SOURCE),
+                                    {'name': 'Ann'})
+
+        response = self.get(view)
+        self.assertFalse(response.is_rendered)
+        self.assertFalse(response.has_header('ETag'))
+        response.context_data['name'] = 'Bob'
+        response = response.render()
+        etag = self.get(make_view('Bob'))['ETag']
+        self.assertEqual(etag, response['ETag'])
+
+        # Rendering the response can turn it into a 304
+        response = self.get(view, etag=self.get(make_view('Ann'))['ETag']).render()
+        self.assertEqual(304, response.status_code)
+
+    @override_settings(TEMPLATES=REQUEST_TEMPLATES)
+    def test_rendered_template_response(self):
+        @jsx_etag
+        def view(request):
+            response = TemplateResponse(request, engines['django'].from_string(SOURCE),
+                                        {'name': 'Ann'})
+            return response.render()
+
+        etag = self.get(make_view('Ann'))['ETag']
+        self.assertEqual(etag, self.get(view)['ETag'])
+        self.assertEqual(304, self.get(view, etag=etag).status_code)
+
+    def test_no_etag(self):
+        # Pages without jsx blocks, POSTs and errors are left alone
+        @jsx_etag
+        def no_blocks(request):
+            return HttpResponse('Hello')
+
+        @jsx_etag
+        def not_found(request):
+            response = render(request, 'Ann')
+            response.status_code = 404
+            return response
+
+        self.assertFalse(self.get(no_blocks).has_header('ETag'))
+        self.assertFalse(self.get(not_found).has_header('ETag'))
+        self.assertFalse(self.get(make_view('Ann'), method='post').has_header('ETag'))
@@ -3,11 +3,11 @@ from __future__ import unicode_literals
 import hashlib
 import json
 import re
-from django.template import Context, Engine
+from django.template import Context, Engine, Variable
 from django.template import TemplateSyntaxError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from django_jsx.templatetags.jsx import set_nested
+from django_jsx.templatetags.jsx import is_plain_data, set_nested
 
 
 RESULT_REGEX = re.compile(
@@ -97,6 +97,10 @@ class JsxTagTest(TestCase):
             ctx = json.loads(unescape(m.group('ctx')))
             self.assertEqual(ctx, expected_ctx)
 
+    def contexts_in(self, result):
+        # The decoded data-ctx of every jsx script tag in `result`, in order
+        return [json.loads(unescape(ctx)) for ctx in re.findall(r'data-ctx="([^"]*)"', result)]
+
     def test_empty_tag(self):
         # No content -> no context
         expected_ctx = {}
@@ -158,6 +162,73 @@ class JsxTagTest(TestCase):
     #         .replace('SHA1', sha1))
     #     self.assertEqual(expected_output, unescape(result))
 
+    def test_declared_fields(self):
+        # With `fields`, only the declared values are serialized, whatever the JSX uses
+        template_content = (
+            '{% load jsx %}{% jsx fields="user.name, user.id" %}'
+            '<Profile user={ctx.user} form={ctx.form}/>{% endjsx %}')
+        context = {'user': {'name': 'Ann', 'id': 3, 'password': 'secret'}, 'form': object()}
+        result = ENGINE.from_string(template_content).render(Context(context))
+        m = RESULT_REGEX.match(result)
+        self.assertEqual(
+            hashlib.sha1('<Profile user={ctx.user} form={ctx.form}/>'.encode('utf-8')).hexdigest(),
+            m.group('sha1'))
+        self.assertEqual({'user': {'name': 'Ann', 'id': 3}}, json.loads(unescape(m.group('ctx'))))
+
+    def test_interning_strings(self):
+        content = '<Table rows={ctx.rows}/>'
+        template_object = ENGINE.from_string(
+            '{% load jsx %}{% jsx intern %}' + content + '{% endjsx %}')
+        rows = [{'status': 'Waiting for review by the team'}] * 4
+        result = template_object.render(Context({'rows': rows}))
+        m = re.match(
+            r'<script type="script/django-jsx" data-sha1="(?P<sha1>[0-9a-f]+)" '
+            r'data-ctx="(?P<ctx>[^"]*)" data-strings="(?P<strings>[^"]*)"></script>$', result)
+        self.assertEqual(hashlib.sha1(content.encode('utf-8')).hexdigest(), m.group('sha1'))
+        self.assertEqual({'rows': [{'status': {'$s': 0}}] * 4},
+                         json.loads(unescape(m.group('ctx'))))
+        self.assertEqual(['Waiting for review by the team'],
+                         json.loads(unescape(m.group('strings'))))
+
+        # Without repeated strings, there's no string table
+        result = template_object.render(Context({'rows': rows[:1]}))
+        self.assertNotIn('data-strings', result)
+        self.assertEqual({'rows': [{'status': 'Waiting for review by the team'}]},
+                         self.contexts_in(result)[0])
+
+    def test_interning_strings_never_grows_output(self):
+        plain = ENGINE.from_string('{% load jsx %}{% jsx %}<T rows={ctx.rows}/>{% endjsx %}')
+        interned = ENGINE.from_string(
+            '{% load jsx %}{% jsx intern %}<T rows={ctx.rows}/>{% endjsx %}')
+        for rows in [
+            [{'a': 'Ten chars.', 'b': 'Eleven char'}] * 2,
+            [{'a': 'Ten chars.', 'b': 'Eleven char', 'c': 'x' * 30}] * 2,
+            [{'a': 'A longer string of text', '$s': 1}] * 3,
+            [{'$s': 'A longer string of text'}] * 3,
+            [{'a': 'Quoted "text" & <markup>'}] * 2,
+            [{'a': 'A status name', 'b': 'Another status'}] * 20,
+            [{'id': i, 'label': 'Label %d, not repeated' % i} for i in range(20)],
+        ]:
+            context = Context({'rows': rows})
+            self.assertLessEqual(len(interned.render(context)), len(plain.render(context)), rows)
+            self.assertEqual(self.contexts_in(plain.render(context))[0]['rows'], rows)
+
+    def test_interning_strings_setting(self):
+        rows = [{'status': 'Waiting for review by the team'}] * 4
+        template_content = '{% load jsx %}{% jsx %}<Table rows={ctx.rows}/>{% endjsx %}'
+        with override_settings(JSX_INTERN_STRINGS=True):
+            result = self.try_it(template_content, None, raw=True, context={'rows': rows})
+        self.assertIn('data-strings="[&quot;Waiting for review by the team&quot;]"', result)
+        # The setting is looked up again once it changes
+        result = self.try_it(template_content, None, raw=True, context={'rows': rows})
+        self.assertNotIn('data-strings', result)
+
+    def test_invalid_options(self):
+        for tag in ['{% jsx foo="bar" %}', '{% jsx fields=user.name %}',
+                    '{% jsx fields="user.name,1bad" %}']:
+            with self.assertRaises(TemplateSyntaxError):
+                ENGINE.from_string('{% load jsx %}' + tag + '<Component/>{% endjsx %}')
+
     def test_block_in_loop(self):
         # We can put a block in a loop, and we get an output tag for each loop iteration
         test_content = '''{% spaceless %}
@@ -175,6 +246,116 @@ class JsxTagTest(TestCase):
             .replace('SHA1', sha1))
         self.assertEqual(expected_output, unescape(result))
 
+    def test_block_in_loop_with_values_from_outside_loop(self):
+        # Values from outside the loop show up in every iteration's output
+        # alongside the loop variable.
+        test_content = '''{% spaceless %}
+        {% load jsx %}
+        {% for i in values %}
+            {% jsx %}<Component key={ ctx.i } label={ ctx.label }/>{% endjsx %}
+        {% endfor %}
+        {% endspaceless %}'''
+        result = self.try_it(test_content, None, raw=True,
+                             context={'values': [1, 2, 3], 'label': 'Label'})
+        sha1 = hashlib.sha1(
+            '<Component key={ ctx.i } label={ ctx.label }/>'.encode('utf-8')).hexdigest()
+        expected_output = ''.join(
+            '<script type="script/django-jsx" data-sha1="%s" '
+            'data-ctx="{"i": %d, "label": "Label"}"></script>' % (sha1, i)
+            for i in [1, 2, 3])
+        self.assertEqual(expected_output, unescape(result))
+
+    def test_block_in_loop_with_callables_from_outside_loop(self):
+        # Callables from outside the loop are called again on each iteration
+        class Counter(object):
+            count = 0
+
+            def next(self):
+                self.count += 1
+                return self.count
+
+        test_content = '''{% load jsx %}{% for i in values %}
+            {% jsx %}<Component n={ ctx.counter.next } label={ ctx.label }/>{% endjsx %}
+        {% endfor %}'''
+        result = self.try_it(test_content, None, raw=True, context={
+            'values': [1, 2, 3], 'counter': Counter(), 'label': lambda: 'Label'})
+        self.assertEqual([{'counter': {'next': n}, 'label': 'Label'} for n in [1, 2, 3]],
+                         self.contexts_in(result))
+
+    def test_block_in_loop_with_cycle(self):
+        # {% cycle ... as foo %} replaces foo in the outer context on each iteration
+        test_content = '''{% load jsx %}{% for i in values %}
+            {% cycle "odd" "even" as foo silent %}{% jsx %}<C v={ctx.foo}/>{% endjsx %}
+        {% endfor %}'''
+        result = self.try_it(test_content, None, raw=True,
+                             context={'values': [1, 2, 3], 'foo': 'initial'})
+        self.assertEqual([{'foo': 'odd'}, {'foo': 'even'}, {'foo': 'odd'}],
+                         self.contexts_in(result))
+
+    def test_block_in_loop_with_lookups_outside_plain_data(self):
+        # Only dict, list and tuple item lookups are cached, not attributes
+        # (which could be properties) or methods
+        class Thing(object):
+            calls = 0
+
+            @property
+            def value(self):
+                self.calls += 1
+                return self.calls
+
+        test_content = '''{% load jsx %}{% for i in values %}
+            {% jsx %}<C a={ctx.thing.value} b={ctx.l.0}/>{% endjsx %}
+        {% endfor %}'''
+        result = self.try_it(test_content, None, raw=True, context={
+            'values': [1, 2], 'thing': Thing(), 'l': ['x']})
+        self.assertEqual([{'thing': {'value': 1}, 'l': {'0': 'x'}},
+                          {'thing': {'value': 2}, 'l': {'0': 'x'}}],
+                         self.contexts_in(result))
+
+        def expressions(*names):
+            return [(name, Variable(name)) for name in names]
+        self.assertTrue(is_plain_data({'a': [{'b': 1}]}, expressions('d.a.0.b', 'd.a')))
+        self.assertFalse(is_plain_data({'a': 1}, expressions('d.keys')))
+        self.assertFalse(is_plain_data({'a': len}, expressions('d.a')))
+        self.assertFalse(is_plain_data(['x'], expressions('l.1')))
+        self.assertFalse(is_plain_data(Thing(), expressions('thing.value')))
+
+    def test_block_in_loop_with_values_set_inside_loop(self):
+        # Values set inside the loop (here by {% with %}) change on each iteration
+        test_content = '''{% spaceless %}
+        {% load jsx %}
+        {% for i in values %}{% with double=i|add:i %}
+            {% jsx %}<Component value={ ctx.double }/>{% endjsx %}
+        {% endwith %}{% endfor %}
+        {% endspaceless %}'''
+        result = self.try_it(test_content, None, raw=True, context={'values': [1, 2]})
+        self.assertEqual([{'double': 2}, {'double': 4}], self.contexts_in(result))
+
+    def test_block_in_nested_loops(self):
+        # The outer loop variable is constant within the inner loop, but not from
+        # one outer iteration to the next.
+        test_content = '''{% spaceless %}
+        {% load jsx %}
+        {% for row in rows %}{% for col in cols %}
+            {% jsx %}<Cell row={ ctx.row } col={ ctx.col }/>{% endjsx %}
+        {% endfor %}{% endfor %}
+        {% endspaceless %}'''
+        result = self.try_it(test_content, None, raw=True,
+                             context={'rows': ['a', 'b'], 'cols': [1, 2]})
+        self.assertEqual([
+            {'row': 'a', 'col': 1}, {'row': 'a', 'col': 2},
+            {'row': 'b', 'col': 1}, {'row': 'b', 'col': 2},
+        ], self.contexts_in(result))
+
+    def test_nested_blocks_with_options(self):
+        test_content = '''
+        {% load jsx %}
+        {% jsx %}
+            {% jsx fields="foo" %}<Component2/>{% endjsx %}
+        {% endjsx %}'''
+        with self.assertRaises(TemplateSyntaxError):
+            self.try_it(test_content, None, raw=True)
+
     def test_nested_blocks(self):
         # Nested JSX blocks are not allowed
         test_content = '''
@@ -0,0 +1,110 @@
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from django.http import HttpResponse
+from django.template import Context, Engine
+from django.test import RequestFactory, TestCase, override_settings
+
+from django_jsx import middleware
+from django_jsx.middleware import JsxPreloadMiddleware, get_usage, preload_links
+
+
+TEMPLATE = Engine.get_default().from_string(
+    '{% load jsx %}'
+    '{% jsx %}<One/>{% endjsx %}'
+    '{% for i in values %}{% jsx %}<Two i={ctx.i}/>{% endjsx %}{% endfor %}')
+
+ONE = hashlib.sha1('<One/>'.encode('utf-8')).hexdigest()
+TWO = hashlib.sha1('<Two i={ctx.i}/>'.encode('utf-8')).hexdigest()
+
+
+class RecordingHandler(logging.Handler):
+    # Keeps the records logged instead of printing them (assertLogs is Python 3 only)
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def view(request):
+    # The same as the `request` context processor would do
+    return HttpResponse(TEMPLATE.render(Context({'request': request, 'values': [1, 2]})))
+
+
+class JsxUsageTest(TestCase):
+    def test_rendering_records_blocks(self):
+        # Each block rendered is recorded once, in order
+        request = RequestFactory().get('/')
+        usage = get_usage(request)
+        view(request)
+        self.assertEqual([ONE, TWO], usage.sha1s)
+        self.assertIs(usage, get_usage(request))
+
+    def test_rendering_without_usage(self):
+        # Nothing is recorded unless someone asked for it
+        request = RequestFactory().get('/')
+        view(request)
+        self.assertFalse(hasattr(request, 'jsx_usage'))
+
+    def test_preload_links(self):
+        manifest = {ONE: 'js/registry.js', TWO: 'js/registry.js', 'abc': 'js/other.js'}
+        with override_settings(STATIC_URL='/static/'):
+            self.assertEqual(
+                ['</static/js/registry.js>; rel=preload; as=script'],
+                preload_links([ONE, TWO, 'unknown'], manifest))
+            self.assertEqual(
+                ['</static/js/other.js>; rel=modulepreload',
+                 '</static/js/registry.js>; rel=modulepreload'],
+                preload_links(['abc', TWO], manifest, rel='modulepreload'))
+
+
+class JsxPreloadMiddlewareTest(TestCase):
+    def setUp(self):
+        (filehandle, self.manifest) = tempfile.mkstemp()
+        with os.fdopen(filehandle, 'w') as f:
+            json.dump({ONE: 'js/one.js', TWO: 'js/two.js'}, f)
+        self.addCleanup(os.remove, self.manifest)
+        self.addCleanup(middleware._manifests.clear)
+
+    def test_link_header(self):
+        with override_settings(JSX_MANIFEST=self.manifest, STATIC_URL='/static/'):
+            response = JsxPreloadMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(
+            '</static/js/one.js>; rel=preload; as=script, '
+            '</static/js/two.js>; rel=preload; as=script',
+            response['Link'])
+
+    def test_existing_link_header_is_kept(self):
+        def view_with_link(request):
+            response = view(request)
+            response['Link'] = '</style.css>; rel=preload; as=style'
+            return response
+
+        with override_settings(JSX_MANIFEST=self.manifest, STATIC_URL='/static/',
+                               JSX_PRELOAD_REL='modulepreload'):
+            response = JsxPreloadMiddleware(view_with_link)(RequestFactory().get('/'))
+        self.assertEqual(
+            '</style.css>; rel=preload; as=style, '
+            '</static/js/one.js>; rel=modulepreload, </static/js/two.js>; rel=modulepreload',
+            response['Link'])
+
+    def test_no_manifest(self):
+        response = JsxPreloadMiddleware(view)(RequestFactory().get('/'))
+        self.assertFalse(response.has_header('Link'))
+
+    def test_missing_manifest(self):
+        handler = RecordingHandler()
+        middleware.logger.addHandler(handler)
+        self.addCleanup(middleware.logger.removeHandler, handler)
+        with override_settings(JSX_MANIFEST=self.manifest + '.missing'):
+            response = JsxPreloadMiddleware(view)(RequestFactory().get('/'))
+        self.assertFalse(response.has_header('Link'))
+        self.assertEqual([logging.ERROR], [record.levelno for record in handler.records])
+        self.assertIn('Could not load the jsx manifest', handler.records[0].getMessage())
@@ -4,7 +4,7 @@ import json
 from django.template import Context
 from django.test import TestCase
 
-from django_jsx.templatetags.jsx import serialize_opportunistically
+from django_jsx.templatetags.jsx import intern_strings, serialize_opportunistically
 
 
 class SerializeOpportunisticallyTest(TestCase):
@@ -120,3 +120,40 @@ class SerializeOpportunisticallyTest(TestCase):
             }
         }
         self.assertEqual(expect, json.loads(result))
+
+    def test_interning_strings(self):
+        # Repeated strings are replaced with references to a string table, if
+        # that makes the output shorter
+        label = 'A long repeated label for each row'
+        obj = {
+            'rows': [{'label': label, 'note': 'Not worth it', 'url': '/only/once/here/'}
+                     for _ in range(3)],
+            'title': label,
+            'short': 'abc',
+        }
+        result, strings = intern_strings(obj)
+        self.assertEqual([label], strings)
+        self.assertEqual({
+            'rows': [{'label': {'$s': 0}, 'note': 'Not worth it', 'url': '/only/once/here/'}
+                     for _ in range(3)],
+            'title': {'$s': 0},
+            'short': 'abc',
+        }, result)
+
+    def test_interning_strings_only_when_shorter(self):
+        # Nothing is interned if the references and the table would cost more than
+        # they save
+        obj = {'rows': [{'a': 'Ten chars.', 'b': 'Eleven char'}] * 2 + [{'c': 'x' * 30}] * 2}
+        result, strings = intern_strings(obj)
+        self.assertIs(obj, result)
+        self.assertEqual([], strings)
+
+    def test_interning_strings_escapes_lookalikes(self):
+        # A dict that looks like a reference gets wrapped so it can't be mistaken for one
+        label = 'A string repeated often enough'
+        result, strings = intern_strings({'a': {'$s': 3}, 'b': (label,) * 3})
+        self.assertEqual({'a': {'$s': [3]}, 'b': [{'$s': 0}] * 3}, result)
+        self.assertEqual([label], strings)
+        # ... unless nothing is interned, when there are no references to mistake it for
+        result, strings = intern_strings({'a': {'$s': 3}, 'b': label})
+        self.assertEqual(({'a': {'$s': 3}, 'b': label}, []), (result, strings))
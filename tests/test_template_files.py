@@ -88,3 +88,26 @@ class TemplateFindingTest(TestCase):
         result = list_template_files()
         expected = [os.path.join(this_dir, "more_templates", "another_template.html")]
         self.assertEqual(set(expected), set(result))
+
+    @override_settings(
+        INSTALLED_APPS=['tests'],
+        TEMPLATES=[
+            {
+                'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                'APP_DIRS': True,
+            },
+        ])
+    def test_filtering_templates(self):
+        this_dir = os.path.dirname(__file__)
+
+        def found(**kwargs):
+            return {
+                os.path.relpath(filename, os.path.join(this_dir, "templates"))
+                for filename in list_template_files(**kwargs)
+            }
+
+        self.assertEqual({"test_file_B.html"}, found(extensions=[".html"]))
+        self.assertEqual({"test_file_A.txt", "test_file_B.html"}, found(include=["test_file_?.*"]))
+        self.assertEqual({"test_file_A.txt", "test_file_B.html"}, found(exclude=["test_dir_C/"]))
+        self.assertEqual({"test_file_A.txt"}, found(exclude=["*.html", "*.zip"]))
+        self.assertEqual(set(), found(include=["*.txt"], extensions=[".html"]))
@@ -0,0 +1,111 @@
+from __future__ import unicode_literals
+
+import json
+import sys
+import threading
+
+from django.template import Context, Engine
+from django.test import TestCase
+
+from django_jsx import compiled
+from django_jsx.compiled import compile_jsx
+
+THREADS = 16
+RENDERS_PER_THREAD = 50
+
+TEMPLATE = (
+    '{% load jsx %}'
+    '{% jsx %}<Header title={ctx.title} user={ctx.user.name}/>{% endjsx %}'
+    '{% for row in rows %}'
+    '{% jsx %}<Row id={ctx.row.id} label={ctx.row.label} title={ctx.title}/>{% endjsx %}'
+    '{% for tag in row.tags %}{% jsx intern %}<Tag tag={ctx.tag} row={ctx.row.id}/>{% endjsx %}'
+    '{% endfor %}'
+    '{% endfor %}'
+    '{% jsx fields="user.name" %}<Footer user={ctx.user}/>{% endjsx %}'
+)
+
+
+def make_context(number):
+    # A different context for each thread, so mixing up renders shows in the output
+    return {
+        'title': 'Page %d' % number,
+        'user': {'name': 'User %d' % number, 'email': 'user%d@example.com' % number},
+        'rows': [
+            {'id': '%d-%d' % (number, i), 'label': 'Row %d of page %d' % (i, number),
+             'tags': ['A tag for page %d' % number] * 3}
+            for i in range(10)
+        ],
+    }
+
+
+class ThreadingTest(TestCase):
+    """
+    Renders the same templates from many threads at once, as a threaded WSGI
+    server would, and checks each render matches rendering it on its own.
+    """
+    def setUp(self):
+        # Switch threads as often as possible, to give races a chance to happen
+        if hasattr(sys, 'setswitchinterval'):
+            self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+            sys.setswitchinterval(1e-6)
+
+    def run_threads(self, target):
+        # Run target(number) in THREADS threads started together, return their results
+        start = threading.Event()
+        results = [None] * THREADS
+        errors = []
+
+        def run(number):
+            start.wait()
+            try:
+                results[number] = target(number)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(number,)) for number in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        return results
+
+    def test_rendering_shared_template(self):
+        template = Engine.get_default().from_string(TEMPLATE)
+        expected = [template.render(Context(make_context(number))) for number in range(THREADS)]
+
+        def render(number):
+            return [template.render(Context(make_context(number)))
+                    for _ in range(RENDERS_PER_THREAD)]
+
+        for number, outputs in enumerate(self.run_threads(render)):
+            self.assertEqual([expected[number]] * RENDERS_PER_THREAD, outputs)
+
+    def test_rendering_in_loops(self):
+        # The loop-invariant fragments are kept per render, so renders of the same
+        # loop in other threads never see each other's
+        template = Engine.get_default().from_string(
+            '{% load jsx %}{% for row in rows %}'
+            '{% jsx %}<Row id={ctx.row} title={ctx.title}/>{% endjsx %}'
+            '{% endfor %}')
+
+        def render(number):
+            outputs = []
+            for i in range(RENDERS_PER_THREAD):
+                title = 'Title %d.%d' % (number, i)
+                outputs.append((title, template.render(
+                    Context({'rows': range(5), 'title': title}))))
+            return outputs
+
+        for outputs in self.run_threads(render):
+            for title, output in outputs:
+                self.assertEqual(5, output.count(json.dumps(title).replace('"', '&quot;')))
+
+    def test_compiling_same_block(self):
+        # Threads compiling the same block at once all get the same CompiledJsx
+        self.addCleanup(compiled._compiled.clear)
+        compiled._compiled.clear()
+        blocks = self.run_threads(
+            lambda number: compile_jsx('<Component a={ctx.foo.bar} b={ctx.baz}/>'))
+        self.assertEqual(1, len(set(id(block) for block in blocks)))